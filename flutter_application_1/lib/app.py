@@ -1,137 +1,377 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_request_context
 import pandas as pd
 import numpy as np
-import ast
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity, pairwise_distances
-from sklearn.decomposition import TruncatedSVD
 import logging
 from collections import deque, defaultdict
 import random
-from sklearn.metrics.pairwise import cosine_similarity
 from flask_cors import CORS
-from collections import defaultdict, deque
-import requests
-import re
+from collections import defaultdict, deque, OrderedDict
 from datetime import datetime, timedelta
 import heapq
-from sklearn.preprocessing import MinMaxScaler
 import os
-import csv
-from sklearn.naive_bayes import MultinomialNB
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.pipeline import make_pipeline
-from sklearn.linear_model import PassiveAggressiveClassifier
-from scipy.sparse import csr_matrix
+from embedding_store import EmbeddingStore
+from embedding_builder import MODEL_NAME, build_embeddings, text_hash
+from catalogue import Catalogue, load_catalogue, normalise_catalogue, catalogue_fingerprint
+from catalogue_manager import CatalogueManager
+from gift_index import GiftProfileIndex
+from vector_index import VectorIndex
+from shared_catalogue import SharedArrayStore, pack_groups, unpack_groups
+from result_cache import ResultCache, normalise_params
+from trending_index import TrendingIndex, price_bands
+from interaction_log import InteractionLogWriter, read_interactions
+from notification_dispatcher import FCM_LEGACY_URL, NotificationDispatcher
+from preference_store import load_preferences, record_preference, replay_preferences, save_preference_snapshot, snapshot_path_for
+import threading
+import atexit
+import queue
+import copy
+import time
+import pickle
+import glob
+import uuid
 
 app = Flask(__name__)
 CORS(app)
 user_preferences = {}
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INTERACTIONS_LOG_PATH = 'interactions_log.csv'
+ITEM_NEIGHBOURS_PATH = os.path.join(BASE_DIR, 'item_neighbours.npz')
+CATALOGUE_CACHE_PATH = os.path.join(BASE_DIR, 'catalogue_cache.npz')
+CONTENT_INDEX_PATH = os.path.join(BASE_DIR, 'content_index.npz')
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
+USER_PREFERENCES_SNAPSHOT_PATH = snapshot_path_for(INTERACTIONS_LOG_PATH)
+PREFERENCE_SNAPSHOT_INTERVAL = 300  # seconds
+user_preferences_lock = threading.Lock()
+
+# Snapshots are written from a copy caught up with the log, so the live
+# dict only ever changes through update_user_preference
+snapshot_preferences = {}
+snapshot_offset = 0
+snapshot_lock = threading.Lock()
+
 def load_user_preferences():
-    """Load preferences from CSV at startup"""
+    """Load preferences from the last snapshot plus the log written since"""
+    global snapshot_offset
     try:
-        with open('interactions_log.csv', 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                user_id = row['user_id']
-                if user_id not in user_preferences:
-                    user_preferences[user_id] = {'likes': [], 'dislikes': []}
-                
-                if row['interaction_type'] == 'like':
-                    user_preferences[user_id]['likes'].append(row['product_id'])
-                else:
-                    user_preferences[user_id]['dislikes'].append(row['product_id'])
-    except FileNotFoundError:
-        pass 
-    
-load_user_preferences()
+        _, offset = load_preferences(
+            INTERACTIONS_LOG_PATH, USER_PREFERENCES_SNAPSHOT_PATH, user_preferences
+        )
+    except Exception as e:
+        logging.error(f"Failed to load user preferences: {e}")
+        return
+    with snapshot_lock:
+        snapshot_preferences.clear()
+        for user_id, prefs in user_preferences.items():
+            snapshot_preferences[user_id] = {'likes': list(prefs['likes']), 'dislikes': list(prefs['dislikes'])}
+        snapshot_offset = offset
+
+def save_user_preferences():
+    """Catch the snapshot copy up with the log and write it if anything was logged"""
+    global snapshot_offset
+    try:
+        interaction_writer.flush()
+        with snapshot_lock:
+            offset, _ = replay_preferences(snapshot_preferences, INTERACTIONS_LOG_PATH, snapshot_offset)
+            if offset != snapshot_offset:
+                save_preference_snapshot(snapshot_preferences, USER_PREFERENCES_SNAPSHOT_PATH, offset)
+                snapshot_offset = offset
+    except Exception as e:
+        logging.error(f"Failed to save user preference snapshot: {e}")
+
+def run_preference_snapshots():
+    while True:
+        time.sleep(PREFERENCE_SNAPSHOT_INTERVAL)
+        save_user_preferences()
+
+# Bumped whenever a user's likes/dislikes change; keys per-user caches
+user_preference_versions = defaultdict(int)
+
+# Ranked /recommend candidates and /more_related responses
+result_cache = ResultCache()
+
+def update_user_preference(user_id, product_id, interaction_type):
+    """Record a like/dislike in memory; repeats and flips are deduplicated"""
+    with user_preferences_lock:
+        changed = record_preference(user_preferences, user_id, product_id, interaction_type)
+        if changed:
+            user_preference_versions[user_id] += 1
+    if changed:
+        result_cache.invalidate_user(user_id)
+    return changed
+
+# Likes/dislikes are appended in batches by a background thread (started by init_resources)
+interaction_writer = None
+
+def sync_item_neighbours(table):
+    """Apply interactions logged since the table's offset (by any worker)"""
+    rows, offset = read_interactions(INTERACTIONS_LOG_PATH, table.log_offset)
+    for row in rows:
+        table.add(row['user_id'], row['product_id'], row['interaction_type'])
+    table.log_offset = offset
+    return len(rows)
+
+def load_item_neighbours():
+    """Load the persisted item neighbour table and replay the log tail"""
+    from item_similarity import ItemNeighbourTable
+    table = ItemNeighbourTable()
+    if os.path.exists(ITEM_NEIGHBOURS_PATH):
+        try:
+            table = ItemNeighbourTable.load(ITEM_NEIGHBOURS_PATH)
+        except Exception as e:
+            logging.error(f"Failed to load item neighbour table, rebuilding: {e}")
+    replayed = sync_item_neighbours(table)
+    logging.info(f"Item neighbour table ready ({len(table.items)} items, {replayed} events replayed)")
+    return table
 
-def generate_embeddings():
-    """Generate and save embeddings if they don't exist"""
-    global amazon_df
+def save_item_neighbours():
+    """Catch up with the log and persist the item neighbour table"""
+    try:
+        interaction_writer.flush()
+        sync_item_neighbours(item_neighbours)
+        item_neighbours.save(ITEM_NEIGHBOURS_PATH)
+    except Exception as e:
+        logging.error(f"Failed to save item neighbour table: {e}")
+
+item_neighbours = None
+ITEM_NEIGHBOURS_SAVE_INTERVAL = 60  # seconds
+
+# Interactions since the last neighbour table save / latent factor fit
+interaction_counts_lock = threading.Lock()
+item_events_since_save = 0
+
+def run_item_neighbour_saves():
+    """Persist the item neighbour table when interactions arrived since the last save"""
+    global item_events_since_save
+    while True:
+        time.sleep(ITEM_NEIGHBOURS_SAVE_INTERVAL)
+        with interaction_counts_lock:
+            events, item_events_since_save = item_events_since_save, 0
+        if events:
+            save_item_neighbours()
+
+EMBEDDING_STORE_PATH = os.path.join(BASE_DIR, 'embedding_store')
+DATASET_PATH = "C:\\Users\\leeye\\A_LYY\\1_FYP\\lucky\\flutter_application_1\\lib\\dataset.csv"
+AMAZON_EMBEDDINGS_PATH = "C:\\Users\\leeye\\A_LYY\\1_FYP\\lucky\\flutter_application_1\\lib\\amazon_with_embeddings.csv"
+AMAZON_PATH = "C:\\Users\\leeye\\A_LYY\\1_FYP\\lucky\\flutter_application_1\\lib\\Amazon products global dataset.csv"
+
+def missing_embeddings(frame, store):
+    """Whether any catalogue product has no vector in the store"""
+    if store.matrix is None:
+        return True
+    return bool((store.rows_for(frame['asin'].tolist()) < 0).any())
+
+def save_embeddings(frame, store, embeddings):
+    """Write embeddings to the binary store and map it"""
+    # Hashed like build_embeddings does, so later builds reuse these vectors
+    hashes = [text_hash(text) for text in frame['text']]
+    store.write(frame['asin'].tolist(), np.stack(embeddings), model_name=MODEL_NAME, hashes=hashes)
+    store.open()
+
+# Only needed to encode products the store has no vector for
+model = None
+model_lock = threading.Lock()
+
+def get_sentence_model():
+    """Load the SentenceTransformer on first use"""
+    global model
+    with model_lock:
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(MODEL_NAME)
+            logging.info("SentenceTransformer model loaded successfully.")
+        return model
+
+def generate_embeddings(frame, store):
+    """Encode products missing from the store (new or changed text) and map it again"""
     logging.info("Generating embeddings...")
-    
-    # Process in smaller chunks to avoid memory issues
-    chunk_size = 100
-    embeddings = []
-    for i in range(0, len(amazon_df), chunk_size):
-        chunk = amazon_df.iloc[i:i+chunk_size]
-        texts = chunk.apply(
-            lambda row: f"{row['title']} {row.get('features', '')} {row.get('department', '')}", 
-            axis=1
-        ).tolist()
-        embeddings.extend(model.encode(texts))
-    
-    amazon_df['embedding'] = embeddings
-    amazon_df.to_csv(embedding_path, index=False)
-    logging.info(f"Saved embeddings to {embedding_path}")
+    build_embeddings(store, frame['asin'], frame['text'], model=get_sentence_model(), model_name=MODEL_NAME)
+    store.open()
+    logging.info(f"Saved embeddings to {EMBEDDING_STORE_PATH}")
 
-# Load datasets
-try:
-    df = pd.read_csv("C:\\Users\\leeye\\A_LYY\\1_FYP\\lucky\\flutter_application_1\\lib\\dataset.csv")
-    
-    embedding_path = "C:\\Users\\leeye\\A_LYY\\1_FYP\\lucky\\flutter_application_1\\lib\\amazon_with_embeddings.csv"
-    if os.path.exists(embedding_path):
-        amazon_df = pd.read_csv(embedding_path)
-        amazon_df['embedding'] = amazon_df['embedding'].apply(
+def load_datasets(store, encode_missing=True):
+    """Read the gift dataset and Amazon catalogue and open the product embedding store.
+
+    Returns (gift_df, amazon_df); raises if either dataset cannot be read.
+    """
+    gift_df = pd.read_csv(DATASET_PATH)
+    if store.exists():
+        # Skip the text embedding column entirely; vectors come from the store
+        catalogue_path = AMAZON_EMBEDDINGS_PATH if os.path.exists(AMAZON_EMBEDDINGS_PATH) else AMAZON_PATH
+        frame = load_catalogue(catalogue_path, CATALOGUE_CACHE_PATH)
+        store.open()
+        if encode_missing and not store.normalised:
+            # Rewritten once with normalised rows so the vector index can share them
+            store.write(store.asins, store.matrix, model_name=store.model_name, hashes=store.hashes or None)
+            store.open()
+        logging.info("Loaded pre-computed embeddings from memory-mapped store")
+    elif os.path.exists(AMAZON_EMBEDDINGS_PATH):
+        # One-off migration of the legacy CSV embeddings into the binary store
+        legacy_df = pd.read_csv(AMAZON_EMBEDDINGS_PATH)
+        embeddings = legacy_df['embedding'].apply(
             lambda x: np.fromstring(x.strip("[]"), sep=" ") if isinstance(x, str) else x
         )
-        logging.info("Loaded pre-computed embeddings")
+        frame = normalise_catalogue(legacy_df)
+        save_embeddings(frame, store, embeddings.tolist())
+        logging.info("Migrated pre-computed embeddings to memory-mapped store")
     else:
-        amazon_df = pd.read_csv("C:\\Users\\leeye\\A_LYY\\1_FYP\\lucky\\flutter_application_1\\lib\\Amazon products global dataset.csv")
-        # Initialize the SentenceTransformer model 
-        if 'model' not in globals():
-            model = SentenceTransformer('all-MiniLM-L6-v2')
-            logging.info("SentenceTransformer model initialized.")
+        frame = load_catalogue(AMAZON_PATH, CATALOGUE_CACHE_PATH)
 
-        if model is not None:
-            generate_embeddings()  
-except Exception as e:
-    logging.error(f"Data loading failed: {e}")
-    df = pd.DataFrame()
-    amazon_df = pd.DataFrame()
-
-# Load the SentenceTransformer model
-try:
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    logging.info("SentenceTransformer model loaded successfully.")
-    
-    # Generate embeddings if they don't exist
-    if not amazon_df.empty and model is not None:
-        if 'embedding' not in amazon_df.columns:
+    if frame.empty or not encode_missing:
+        return gift_df, frame
+
+    # Encode products the store has no vector for (new store or a catalogue refresh)
+    try:
+        if missing_embeddings(frame, store):
             logging.info("Generating product embeddings (this may take several minutes)...")
-            
-            # Create embeddings using title + features + department
-            def generate_embedding(row):
-                features = " ".join(row['features']) if isinstance(row.get('features'), list) else ""
-                text = f"{row['title']} {features} {row.get('department', '')}"
-                return model.encode(text)
-            
-            # Process in chunks to avoid memory issues
-            chunk_size = 500
-            embeddings = []
-            for i in range(0, len(amazon_df), chunk_size):
-                chunk = amazon_df.iloc[i:i+chunk_size]
-                embeddings.extend(chunk.apply(generate_embedding, axis=1))
-            
-            amazon_df['embedding'] = embeddings
-            
-            embedding_path = "C:\\Users\\leeye\\A_LYY\\1_FYP\\lucky\\flutter_application_1\\lib\\amazon_with_embeddings.csv"
-            amazon_df.to_csv(embedding_path, index=False)
-            logging.info(f"Embeddings generated and saved to {embedding_path}")
+            generate_embeddings(frame, store)
         else:
             logging.info("Embeddings already exist in the dataset")
-            
-        if 'embedding' in amazon_df.columns:
-            logging.info(f"Embedding check: First embedding length = {len(amazon_df.iloc[0]['embedding'])}")
-            
-except Exception as e:
-    logging.error(f"Failed to initialize embeddings: {e}")
-    model = None
+    except Exception as e:
+        logging.error(f"Failed to initialize embeddings: {e}")
+    return gift_df, frame
+
+# Serving with several worker processes: one loader (publish_catalogue.py)
+# publishes the catalogue arrays here and every worker maps them read-only
+SHARED_CATALOGUE_DIR = os.environ.get('SHARED_CATALOGUE_DIR')
+
+def file_stamp(paths):
+    """(size, mtime) of each file, None where it is missing"""
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+def dataset_source_stamp():
+    return file_stamp((DATASET_PATH, AMAZON_EMBEDDINGS_PATH, AMAZON_PATH))
+
+def catalogue_source_stamp():
+    """Stamp of whatever a new catalogue version would be built from"""
+    if SHARED_CATALOGUE_DIR is not None:
+        # Workers follow the loader's publishes rather than the datasets themselves
+        return file_stamp((SharedArrayStore(SHARED_CATALOGUE_DIR).index_path,))
+    return dataset_source_stamp()
+
+def build_vector_index(frame, store):
+    """ANN index over the frame rows that have a vector in the store"""
+    rows = store.rows_for(frame['asin'].tolist())
+    has_vector = rows >= 0
+    # Scores straight from the mapped matrix; only stores written before
+    # rows were normalised on disk need a private copy
+    return VectorIndex().build(
+        store.matrix,
+        ids=np.flatnonzero(has_vector),
+        departments=frame['department'].values[has_vector],
+        version=store.version,
+        rows=rows[has_vector],
+        normalised=store.normalised
+    )
+
+def ensure_vector_index(state):
+    """Return the version's ANN index; a newer embedding store on disk triggers a catalogue reload"""
+    store = state['embedding_store']
+    if SHARED_CATALOGUE_DIR is None and store is not None and store.version is not None and store.is_stale():
+        if catalogue_manager.reload():
+            logging.info("Embedding store changed on disk, reloading catalogue")
+    return state['vector_index']
+
+def random_product_payload(catalogue, row):
+    """/recommend_random_products entry for a catalogue row"""
+    return {
+        "Product Name": catalogue.title[row],
+        "department": catalogue.department[row],
+        "images": catalogue.images[row],
+        "url": catalogue.url[row],
+        "price": str(price_bands([catalogue.columns['initial_price'][row]])[0]),
+        "Rating": float(catalogue.columns['rating'][row]),
+    }
+
+def trending_payload(catalogue, row):
+    """fetch_random_recommendations entry for a catalogue row"""
+    return {
+        "Product Name": catalogue.title[row],
+        "department": catalogue.department[row],
+        "images": catalogue.images[row],
+        "url": catalogue.url[row],
+        "price": float(catalogue.columns['final_price'][row]),
+        "Rating": float(catalogue.columns['rating'][row]),
+        "Popularity": float(catalogue.columns['reviews_count'][row]),
+        "features": catalogue.features_text[row],
+    }
+
+def build_trending_index(frame):
+    """Catalogue rows in popularity order, whole and per department / price band"""
+    return TrendingIndex().build(
+        frame['asin'], frame['reviews_count'], frame['department'], frame['final_price'], source=id(frame)
+    )
+
+latent_model = None
+latent_events_since_fit = 0
+LATENT_REFIT_INTERVAL = 600  # seconds
+
+def refit_latent_factors(state=None):
+    """Factorise the current interactions and swap in the new model.
+
+    `state` is the catalogue version to fold in (the live one by default).
+    """
+    global latent_model, latent_events_since_fit
+    if state is None:
+        state = current_catalogue()
+    catalogue, index = state['catalogue'], state['vector_index']
+    with interaction_counts_lock:
+        events = latent_events_since_fit
+    ratings, user_idx, item_idx = item_neighbours.interaction_matrix()
+    catalogue_ids = catalogue_embeddings = None
+    if catalogue is not None and index is not None:
+        # The vector index holds a (normalised) vector for every row that has one
+        has_vector, catalogue_embeddings = index.vectors_for(catalogue.unique_rows)
+        catalogue_ids = catalogue.asin.take(catalogue.unique_rows[has_vector]).tolist()
+    from latent_factors import LatentFactorModel
+    latent_model = LatentFactorModel().fit(
+        ratings,
+        user_ids=sorted(user_idx, key=user_idx.get),
+        item_ids=sorted(item_idx, key=item_idx.get),
+        catalogue_ids=catalogue_ids,
+        catalogue_embeddings=catalogue_embeddings
+    )
+    with interaction_counts_lock:
+        latent_events_since_fit -= events
+
+def run_latent_refits():
+    while True:
+        if latent_model is None or latent_events_since_fit > 0:
+            try:
+                refit_latent_factors()
+            except Exception as e:
+                logging.error(f"Latent factor refit failed: {e}")
+        time.sleep(LATENT_REFIT_INTERVAL)
+
+def load_content_index(frame):
+    """Load the persisted TF-IDF content index, rebuilding it when the catalogue changed"""
+    from content_index import ContentIndex
+    fingerprint = catalogue_fingerprint(frame)
+    if os.path.exists(CONTENT_INDEX_PATH):
+        try:
+            index = ContentIndex.load(CONTENT_INDEX_PATH)
+            if index.fingerprint == fingerprint:
+                logging.info(f"Loaded content index from {CONTENT_INDEX_PATH}")
+                return index
+        except Exception as e:
+            logging.error(f"Failed to read content index, rebuilding: {e}")
+
+    index = ContentIndex().build(frame['features_text'], frame['categories'], fingerprint)
+    try:
+        index.save(CONTENT_INDEX_PATH)
+    except Exception as e:
+        logging.error(f"Failed to save content index: {e}")
+    return index
 
 # mapping between interests and Amazon departments
 interest_to_department = {
@@ -149,6 +389,87 @@ interest_to_department = {
     "Entertainment": ["Video Games", "Electronics", "Toys & Games"]
 }
 
+def parse_age_range(age_range):
+    """Return (start_age, end_age, is_kid) for inputs like '20-30', '65+' or '8'"""
+    if '-' in age_range:
+        start_age, end_age = map(int, age_range.split('-'))
+        is_kid = start_age >= 0 and end_age <= 14
+    else:
+        start_age = int(age_range.replace('+', ''))
+        end_age = float('inf') if age_range.strip().endswith('+') else start_age
+        is_kid = start_age <= 14
+    return start_age, end_age, is_kid
+
+def parse_price_range(price_range):
+    """Return (min_price, max_price) for inputs like '0-50' or '100+'"""
+    if price_range.strip().endswith('+'):
+        return float(price_range.replace('+', '')), float('inf')
+    min_price, max_price = map(float, price_range.split('-'))
+    return min_price, max_price
+
+def resolve_interests(occasion, gender, age_range):
+    """Dataset interests matching the profile filters; ages 0-14 always map to Kids"""
+    is_kid = False
+    age_span = None
+    if age_range:
+        start_age, end_age, is_kid = parse_age_range(age_range)
+        if not is_kid:  # Only apply age filter if not a kid
+            age_span = (start_age, end_age)
+
+    # If age range is for kids (0-14), override interests with "Kids"
+    if is_kid:
+        logging.info("Age range 0-14 detected, setting interest to 'Kids'")
+        return ["Kids"]
+
+    # Filter dataset rows by intersecting the precomputed bitsets
+    gift_index = current_catalogue()['gift_index']
+    return gift_index.interests(gift_index.match(occasion=occasion, gender=gender, age_span=age_span))
+
+# A gender filter drops products tagged for the other gender (the app sends Male/Female)
+GENDER_EXCLUDED_TAG = {'women': 'men', 'female': 'men', 'men': 'women', 'male': 'women'}
+
+def build_fallback_rows(gift, catalogue):
+    """Rows of the loosest /recommend fallback level, one per asin"""
+    rows = gift.catalogue_rows(list(interest_to_department))
+    rows = rows[~pd.Series(catalogue.asin_id[rows]).duplicated().to_numpy()]
+    logging.info(f"Built fallback candidate set with {len(rows)} products")
+    return rows
+
+def fallback_level_mask(rows, level):
+    """Vectorised mask of the candidate rows passing one fallback level"""
+    state = current_catalogue()
+    mask = np.ones(len(rows), dtype=bool)
+
+    interests = resolve_interests(level.get("occasion"), level.get("gender"), level.get("age_range"))
+    mask &= np.isin(rows, state['gift_index'].catalogue_rows(interests))
+
+    if level.get("price_range"):
+        min_price, max_price = parse_price_range(level["price_range"])
+        price = state['catalogue'].columns['final_price'][rows]
+        mask &= (price >= min_price) & (price <= max_price)
+
+    excluded_tag = GENDER_EXCLUDED_TAG.get((level.get("gender") or "").lower())
+    if excluded_tag:
+        gender_tag = state['catalogue'].gender_tag
+        mask &= gender_tag.codes[rows] != gender_tag.code(excluded_tag)
+
+    # Products carry no age_group, so the old per-product age check never excluded anything
+    return mask
+
+def select_fallback_level(fallback_levels):
+    """Strictest fallback level with any candidates, and its candidate products"""
+    state = current_catalogue()
+    rows = state['fallback_rows']
+    for level in fallback_levels:
+        try:
+            mask = fallback_level_mask(rows, level)
+        except Exception as e:
+            logging.error(f"Invalid filters in fallback level {level}: {e}")
+            continue
+        if mask.any():
+            return level, state['amazon_df'].iloc[rows[mask]]
+    return None, state['amazon_df'].iloc[:0]
+
 #for helpful? if user input helpful = like product 
 @app.route('/like_product', methods=['POST'])
 def like_product():
@@ -156,27 +477,21 @@ def like_product():
         data = request.json
         user_id = data['user_id']
         product_id = data['product_id']
+        catalogue = current_catalogue()['catalogue']
         
-        # track interaction - pass a dictionary
+        # track interaction and learn from positive feedback
         track_interaction({
             'user_id': user_id,
             'product_id': product_id, 
             'interaction_type': 'like',
             'timestamp': datetime.now().isoformat()
-        })
+        }, feedback_text=catalogue.text(product_id))
         
         # Get product info
-        product = amazon_df[amazon_df['asin'] == product_id].iloc[0]
-        features = " ".join(product.get('features', []))
-        text = f"{product['title']} {features} {product.get('department', '')}"
-        
-        # Learn from positive feedback
-        preference_model.learn_from_feedback(text, liked=True)
+        product = catalogue.product(product_id)
         
         # Update user preferences
-        if user_id not in user_preferences:
-            user_preferences[user_id] = {'likes': [], 'dislikes': []}
-        user_preferences[user_id]['likes'].append(product_id)
+        update_user_preference(user_id, product_id, 'like')
         
         return jsonify({
             "status": "success",
@@ -191,10 +506,7 @@ def like_product():
                 "title": product['title'],
                 "department": product.get('department', '')
             },
-            "model_status": {
-                "is_trained": preference_model.is_trained,
-                "last_updated": datetime.now().isoformat()
-            }
+            "model_status": preference_model.status()
         })
         
     except Exception as e:
@@ -213,35 +525,26 @@ def dislike_product():
         data = request.json
         user_id = data['user_id']
         product_id = data['product_id']
+        catalogue = current_catalogue()['catalogue']
         
-        # Track the interaction
+        # Track the interaction and learn from this negative feedback
         track_interaction({
             'user_id': user_id,
             'product_id': product_id,
             'interaction_type': 'dislike',
             'timestamp': datetime.now().isoformat()
-        })
+        }, feedback_text=catalogue.text(product_id))
         
         # Get product info
-        product = amazon_df[amazon_df['asin'] == product_id].iloc[0]
-        features = " ".join(product.get('features', []))
-        text = f"{product['title']} {features} {product.get('department', '')}"
-        
-        # Learn from this negative feedback
-        preference_model.learn_from_feedback(text, liked=False)
+        product = catalogue.product(product_id)
         
         # Store in user preferences
-        if user_id not in user_preferences:
-            user_preferences[user_id] = {'likes': [], 'dislikes': []}
-        user_preferences[user_id]['dislikes'].append(product_id)
+        update_user_preference(user_id, product_id, 'dislike')
         
         return jsonify({
             "status": "success",
             "message": "Dislike recorded",
-            "model_status": {
-                "is_trained": preference_model.is_trained,
-                "vocab_size": len(getattr(preference_model.model.steps[0][1], 'vocabulary_', {}))
-            }
+            "model_status": preference_model.status()
         })
         
     except Exception as e:
@@ -254,51 +557,33 @@ def dislike_product():
 
 def build_interaction_matrix():
     """Convert user interactions to a sparse matrix"""
-    
-    all_users = list(user_interactions.keys())
-    all_items = list(item_popularity.keys())
-    
-    user_idx = {u: i for i, u in enumerate(all_users)}
-    item_idx = {p: i for i, p in enumerate(all_items)}
-    
-    # Build sparse matrix
-    rows, cols, data = [], [], []
-    for user, items in user_interactions.items():
-        for item, score in items.items():
-            rows.append(user_idx[user])
-            cols.append(item_idx[item])
-            data.append(score)
-    
-    return csr_matrix((data, (rows, cols))), user_idx, item_idx
+    return item_neighbours.interaction_matrix()
+
+def collaborative_scores(user_id, top_n=10):
+    """Raw (asin, score) collaborative filtering candidates for a user"""
+    model = latent_model
+    ratings = item_neighbours.user_ratings(user_id)
+    # Latent factors folded in from the user's current ratings; the item
+    # neighbour table covers the time before the first fit
+    recs = model.recommend(user_id, top_n, ratings=ratings) if model is not None else []
+    if not recs:
+        recs = item_neighbours.recommend(user_id, top_n)
+    return recs
 
 def collaborative_recommendations(user_id, top_n=10):
     """Generate recommendations using collaborative filtering"""
-    # Build the interaction matrix
-    inter_matrix, user_idx, item_idx = build_interaction_matrix()
-    
-    # Compute item-item similarities
-    item_sim = cosine_similarity(inter_matrix.T)
-    
-    # Get user's liked items
-    user_likes = user_interactions.get(user_id, {})
-    
-    # Generate recommendations
-    rec_scores = defaultdict(float)
-    for liked_item, score in user_likes.items():
-        if liked_item in item_idx:
-            item_index = item_idx[liked_item]
-            for other_index, sim_score in enumerate(item_sim[item_index]):
-                other_item = list(item_idx.keys())[other_index]  # Simplified lookup
-                rec_scores[other_item] += sim_score * score
+    prefs = user_preferences.get(user_id, {'likes': [], 'dislikes': []})
+
+    # Over-fetch so penalised dislikes can drop out of the final top_n
+    rec_scores = defaultdict(float, collaborative_scores(user_id, top_n + len(prefs['dislikes'])))
     
     # Boost items the user has explicitly liked
-    if user_id in user_preferences:
-        for liked_item in user_preferences[user_id]['likes']:
-            rec_scores[liked_item] += 3.0  # Strong boost
-            
-        # Penalize disliked items
-        for disliked_item in user_preferences[user_id]['dislikes']:
-            rec_scores[disliked_item] -= 2.0  # Strong penalty
+    for liked_item in prefs['likes']:
+        rec_scores[liked_item] += 3.0  # Strong boost
+        
+    # Penalize disliked items
+    for disliked_item in prefs['dislikes']:
+        rec_scores[disliked_item] -= 2.0  # Strong penalty
     
     return heapq.nlargest(top_n, rec_scores.items(), key=lambda x: x[1])
     
@@ -319,37 +604,22 @@ def recommend():
         limit = data.get("limit", 15)
         recent_departments = data.get("recent_departments", [])
         exploration_rate = data.get("exploration_rate", 0.3)
+        state = current_catalogue()
 
         def matches_gender(product, gender_filter):
-            if not gender_filter:
+            excluded_tag = GENDER_EXCLUDED_TAG.get((gender_filter or "").lower())
+            if not excluded_tag:
                 return True
-
-            title = product.get('title', '').lower()
-            description = product.get('description', '').lower()
-
-            # Define gender-specific keywords
-            men_keywords = ['men', 'male', 'boy', "men's", "boy's"]
-            women_keywords = ['women', 'female', 'girl', "women's", "girl's"]
-
-            if gender_filter.lower() == 'women':
-                if any(word in title or word in description for word in men_keywords):
-                    return False
-                if any(word in title or word in description for word in women_keywords):
-                    return True
-            elif gender_filter.lower() == 'men':
-                if any(word in title or word in description for word in women_keywords):
-                    return False
-                if any(word in title or word in description for word in men_keywords):
-                    return True
-
-            return True
+            # Payloads carry the title; the tag was computed at load time
+            rows = state['catalogue'].rows_for_title(product.get('Product Name'))
+            return not rows or state['catalogue'].gender_tag[rows[0]] != excluded_tag
 
         def filter_products(products, filters):
             filtered = []
             for product in products:
                 # Price filter
                 if filters.get('price_range'):
-                    min_price, max_price = map(float, filters['price_range'].split('-'))
+                    min_price, max_price = parse_price_range(filters['price_range'])
                     if not (min_price <= product.get('price', 0) <= max_price):
                         continue
                 
@@ -376,19 +646,24 @@ def recommend():
             {"occasion": None, "gender": None, "age_range": None, "price_range": None},
         ]
         
-        recommendations = []
-        for level in fallback_levels:
-            logging.info(f"Trying fallback level: {level}")
-            
-            # Get existing recommendations ()
-            base_recommendations = fetch_personalized_recommendations(
-                {**data, **level}, 
-                recent_departments
-            )
-            
-            # Apply strict filtering (existing)
-            filtered = filter_products(base_recommendations, level)
-            
+        # Ranked candidates are cached; exploration is mixed in per response
+        user_id = data.get('user_id')
+        cache_key = ('recommend', normalise_params({
+            "occasion": occasion, "gender": gender, "age_range": age_range, "price_range": price_range,
+            "limit": limit, "recent_departments": recent_departments, "user_id": user_id,
+        }), user_preference_versions.get(user_id, 0), catalogue_version_id())
+        cached = result_cache.get(cache_key)
+        if cached is None:
+            # Evaluate every level as a mask over one candidate set and keep the strictest non-empty one
+            level, candidates = select_fallback_level(fallback_levels)
+            filtered = rank_candidates(candidates, {**data, **level}, recent_departments) if level is not None else []
+            cached = (level, filtered)
+            result_cache.put(cache_key, cached, user_id)
+        level, filtered = cached
+
+        if level is not None:
+            logging.info(f"Selected fallback level: {level}")
+
             if filtered:
                 
                 if exploration_rate > 0:
@@ -424,71 +699,20 @@ def recommend():
 def recommend_random_products():
     try:
         # Ensure the Amazon dataset is loaded
-        if amazon_df.empty:
+        state = current_catalogue()
+        if state['amazon_df'].empty:
             logging.error("Amazon dataset is empty or not loaded.")
             return jsonify({"error": "Amazon dataset not available"}), 500
 
-        category_dict = defaultdict(list)
-
-        # Group products by category
-        for _, row in amazon_df.iterrows():
-            try:
-                # Handle invalid or missing price values
-                price_val = row.get("initial_price")
-                if pd.isna(price_val):
-                    price = 0.0
-                elif isinstance(price_val, str):
-                    if price_val.strip() == "" or price_val.lower() == "null":
-                        price = 0.0
-                    else:
-                        # Remove any non-numeric characters (e.g., currency symbols, quotes)
-                        price_str = ''.join(filter(lambda x: x.isdigit() or x == '.', price_val))
-                        price = float(price_str)
-                else: 
-                    price = float(price_val)
-            except (ValueError, TypeError) as e:
-                logging.warning(f"Invalid price value: {row.get('initial_price')}. Defaulting to 0.0. Error: {e}")
-                price = 0.0
-
-            price_range = get_price_range(price)
-
-            try:
-                # Handle invalid or missing rating values
-                rating_val = row.get("rating")
-                if pd.isna(rating_val):
-                    rating = 0.0
-                elif isinstance(rating_val, str):
-                    if rating_val.strip() == "" or rating_val.lower() == "null":
-                        rating = 0.0
-                    else:
-                        # Remove any non-numeric characters (e.g., quotes, text)
-                        rating_str = ''.join(filter(lambda x: x.isdigit() or x == '.', rating_val))
-                        rating = float(rating_str)
-                else: 
-                    rating = float(rating_val)
-            except (ValueError, TypeError) as e:
-                logging.warning(f"Invalid rating value: {row.get('rating')}. Defaulting to 0.0. Error: {e}")
-                rating = 0.0
-
-            category = row.get("department", "Unknown Category") 
-            product = {
-                "Product Name": row.get("title", "Unknown Product"),
-                "department": category,
-                "images": row.get("images", ""),
-                "url": row.get("url", ""),
-                "price": price_range,
-                "Rating": rating,
-            }
-            category_dict[category].append(product)
-
-        # Select one random product from each category
-        recommendations = {
-            category: random.choice(items) for category, items in category_dict.items() if items
-        }
+        # Optional seed makes the draw reproducible
+        rng = random.Random(request.args.get('seed', type=int))
 
-        # Convert the dictionary values to a list and limit it to 20 products
-        recommendations_list = list(recommendations.values())
-        limited_recommendations = recommendations_list[:20]  # Limit to 20 products
+        # Select one random product from each category (limited to 20 products)
+        limited_recommendations = [
+            random_product_payload(state['catalogue'], rows[rng.randrange(len(rows))])
+            for rows in list(state['department_buckets'].values())[:20]
+            if len(rows)
+        ]
 
         return jsonify({"recommend_random_products": limited_recommendations})
 
@@ -496,35 +720,20 @@ def recommend_random_products():
         logging.error(f"Error in /recommend_random_products endpoint: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
     
-def fetch_random_recommendations(limit=10):
+def fetch_random_recommendations(limit=10, department=None, price_band=None):
     try:
-        # Fetch random products
-        random_products = amazon_df.sample(n=limit)
-
-        # Fetch trending products (e.g., products with the highest popularity)
-        trending_products = amazon_df.sort_values(by="reviews_count", ascending=False).head(limit)
-
-        # Combine random and trending products
-        recommendations = pd.concat([random_products, trending_products]).drop_duplicates(subset=['asin']).head(limit)
-
-        recommendations_list = []
-        for _, row in recommendations.iterrows():
-            features = row.get("features", [])
-            if isinstance(features, list):
-                features = " ".join(features)
-
-            recommendations_list.append({
-                "Product Name": row.get("title", "Unknown Product"),
-                "department": row.get("department", "Unknown Department"),
-                "images": row.get("images", ""),
-                "url": row.get("url", ""),
-                "price": float(row.get("final_price", 0.0)) if pd.notna(row.get("final_price")) else 0.0,
-                "Rating": float(row.get("rating", 0.0)) if pd.notna(row.get("rating")) else 0.0,
-                "Popularity": row.get("reviews_count", 0.0) if pd.notna(row.get("reviews_count")) else 0,
-                "features": features,  
-            })
+        state = current_catalogue()
+        index = state['trending_index']
+        if index is None:
+            return []
+
+        # Random products first, topped up with trending ones (one per asin)
+        rows = list(index.sample(limit, department, price_band))
+        if len(rows) < limit:
+            seen = set(rows)
+            rows.extend(row for row in index.top(limit, department, price_band) if row not in seen)
 
-        return recommendations_list
+        return [trending_payload(state['catalogue'], row) for row in rows[:limit]]
     except Exception as e:
         logging.error(f"Error in fetch_random_recommendations: {e}")
         return []
@@ -546,118 +755,116 @@ def combine_recommendations(personalized_recommendations, random_recommendations
         logging.error(f"Error in combine_recommendations: {e}")
         return personalized_recommendations
 
-def calculate_preference_score(product_row, user_id):
-    """Calculate personalized score based on user preferences"""
-    try:
-        # Base score from popularity/features
-        score = product_row.get('reviews_count', 0) / 1000
-        
-        # Add preference model score if available
-        if preference_model.is_trained:
-            features = " ".join(product_row.get('features', []))
-            text = f"{product_row['title']} {features} {product_row.get('department', '')}"
-            score += preference_model.predict_preference(text) * 2
-            
-        # Boost liked items
-        if user_id in user_preferences:
-            if product_row['asin'] in user_preferences[user_id]['likes']:
-                score += 3
-            if product_row['asin'] in user_preferences[user_id]['dislikes']:
-                score -= 2
-                
-        return max(0, score)  # Ensure non-negative
-        
-    except Exception as e:
-        logging.error(f"Error in calculate_preference_score: {e}")
-        return 0
+def ensure_catalogue_features():
+    """Hashed text features for every catalogue row, computed once per version (the hashing is stateless)"""
+    state = current_catalogue()
+    catalogue = state['catalogue']
+    if state['catalogue_features'] is None or state['catalogue_features'].shape[0] != len(catalogue):
+        start = time.time()
+        state['catalogue_features'] = preference_model.vectorizer.transform(catalogue.texts())
+        logging.info(f"Vectorised {len(catalogue)} catalogue texts in {time.time() - start:.2f}s")
+    return state['catalogue_features']
+
+def calculate_preference_scores(products, user_id):
+    """Personalised score for every candidate row at once"""
+    # Base score from popularity/features
+    scores = products['reviews_count'].to_numpy(dtype=np.float64) / 1000
+
+    # One decision_function call over the candidates' pre-vectorised text
+    if preference_model.is_trained:
+        features = ensure_catalogue_features()[products.index.to_numpy()]
+        scores += preference_model.decision_features(features) * 2
+
+    # Boost liked items, penalise disliked ones
+    prefs = user_preferences.get(user_id)
+    if prefs:
+        catalogue = current_catalogue()['catalogue']
+        asin_ids = products['asin_id']
+        scores += 3 * asin_ids.isin(catalogue.asin_rows(prefs['likes'])).to_numpy()
+        scores -= 2 * asin_ids.isin(catalogue.asin_rows(prefs['dislikes'])).to_numpy()
+
+    return np.maximum(scores, 0)  # Ensure non-negative
+
+def top_k_order(scores, k):
+    """Positions of the k highest scores, best first"""
+    if k < len(scores):
+        top = np.argpartition(-scores, k)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind='stable')]
     
+CANDIDATE_POOL_SIZE = 2000
+
+def build_candidate_pool(catalogue):
+    """Most popular catalogue rows (one per asin) and every row's popularity score"""
+    popularity = np.log1p(catalogue.columns['reviews_count'].astype(np.float64))
+    popularity *= catalogue.columns['rating'].astype(np.float64)
+    popularity /= popularity.max() or 1.0
+    unique_rows = catalogue.unique_rows
+    top = top_k_order(popularity[unique_rows], CANDIDATE_POOL_SIZE)
+    return np.sort(unique_rows[top]), popularity
+
+def ensure_candidate_pool():
+    """Candidate rows ranked for every user by predict_preference, and every row's popularity"""
+    state = current_catalogue()
+    if state['candidate_pool_rows'] is None or len(state['catalogue_popularity']) != len(state['amazon_df']):
+        state['candidate_pool_rows'], state['catalogue_popularity'] = build_candidate_pool(state['catalogue'])
+    return state['candidate_pool_rows'], state['catalogue_popularity']
+
+def rank_user_candidates(user_id, k):
+    """Top-k asins from classifier score, collaborative score, like/dislike boosts and popularity"""
+    catalogue = current_catalogue()['catalogue']
+    pool, catalogue_popularity = ensure_candidate_pool()
+    cf_scores = {}
+    for asin, score in collaborative_scores(user_id, k):
+        row = catalogue.row_for_asin(asin)
+        if row is not None:
+            cf_scores[row] = score
+    rows = np.union1d(pool, np.fromiter(cf_scores, dtype=np.int64, count=len(cf_scores)))
+
+    scores = catalogue_popularity[rows].copy()
+    if preference_model.is_trained:
+        scores += preference_model.decision_features(ensure_catalogue_features()[rows]) * 2
+    if cf_scores:
+        scores[np.searchsorted(rows, list(cf_scores))] += list(cf_scores.values())
+
+    asins = catalogue.asin.take(rows)
+    prefs = user_preferences.get(user_id)
+    if prefs:
+        scores += 3 * np.isin(asins, prefs['likes'])
+        scores -= 2 * np.isin(asins, prefs['dislikes'])
+
+    return asins[top_k_order(scores, k)].tolist()
+
 def fetch_personalized_recommendations(data, recent_departments):
     try:
         occasion = data.get("occasion")
         gender = data.get("gender")
         age_range = data.get("age_range")
         price_range = data.get("price_range")
-        limit = data.get("limit", 15)
         offset = data.get("offset", 0)
         bs_category = data.get("bs_category")
 
-        # Filter dataset based on input (optional filters)
-        filtered_df = df.copy()
-
-        if occasion:
-            if isinstance(occasion, list):
-                filtered_df = filtered_df[filtered_df['Occasion'].isin(occasion)]
-            else:
-                filtered_df = filtered_df[filtered_df['Occasion'].str.contains(occasion, case=False, na=False)]
-        if gender:
-            filtered_df = filtered_df[filtered_df['Gender'].str.contains(gender, case=False, na=False)]
-        
-        # Check if age range is for kids (0-14)
-        is_kid = False
-        if age_range:
-            try:
-                if '-' in age_range:
-                    start_age, end_age = map(int, age_range.split('-'))
-                    if start_age >= 0 and end_age <= 14:
-                        is_kid = True
-                else:
-                    age = int(age_range.replace('+', ''))
-                    if age <= 14:
-                        is_kid = True
-                
-                if not is_kid:  # Only apply age filter if not a kid
-                    filtered_df = filtered_df[filtered_df['Age'].between(start_age, end_age)]
-            except Exception as e:
-                logging.error(f"Invalid age range: {age_range}. Error: {e}")
-                return []
+        try:
+            interests = resolve_interests(occasion, gender, age_range)
+        except Exception as e:
+            logging.error(f"Invalid age range: {age_range}. Error: {e}")
+            return []
 
-        if filtered_df.empty and not is_kid:
+        if not interests:
             logging.warning("No matching products found after filtering.")
             return []
 
-        # If age range is for kids (0-14), override interests with "Kids"
-        if is_kid:
-            interests = ["Kids"]
-            logging.info("Age range 0-14 detected, setting interest to 'Kids'")
-        else:
-            interests = filtered_df['Interest'].unique().tolist()
-
-        # Map interests to Amazon departments
-        departments = []
-        for interest in interests:
-            departments.extend(interest_to_department.get(interest, []))
+        # Amazon products in the departments mapped from those interests
+        state = current_catalogue()
+        recommended_products = state['amazon_df'].iloc[state['gift_index'].catalogue_rows(interests)]
+        unique_recommended_products = recommended_products.drop_duplicates(subset=['asin_id'])
 
-        # Remove duplicates in departments
-        departments = list(set(departments))
-
-        # Filter Amazon products based on the mapped departments
-        recommended_products = amazon_df[amazon_df['department'].isin(departments)]
-        unique_recommended_products = recommended_products.drop_duplicates(subset=['asin'])
-        
-        # Apply personalization based on user preferences if available
-        user_id = data.get('user_id')
-        if user_id and user_id in user_preferences:
-            # Score products based on learned preferences
-            unique_recommended_products['preference_score'] = unique_recommended_products.apply(
-                lambda row: calculate_preference_score(row, user_id), 
-                axis=1
-            )
-            # Sort by preference score
-            unique_recommended_products = unique_recommended_products.sort_values(
-                by='preference_score', 
-                ascending=False
-            )
-            
         # Apply price range filtering if price_range is provided
         if price_range:
             logging.info(f"Applying price range filtering: {price_range}")
             try:
-                if price_range == "100+":
-                    min_price = 100
-                    max_price = float('inf')
-                else:
-                    min_price, max_price = map(float, price_range.split('-'))
-                
+                min_price, max_price = parse_price_range(price_range)
                 unique_recommended_products = unique_recommended_products[
                     (unique_recommended_products['final_price'] >= min_price) &
                     (unique_recommended_products['final_price'] <= max_price)
@@ -666,86 +873,82 @@ def fetch_personalized_recommendations(data, recent_departments):
                 logging.error(f"Invalid price range: {price_range}. Error: {e}")
                 return []
 
+        return rank_candidates(unique_recommended_products, data, recent_departments)
+
+    except Exception as e:
+        logging.error(f"Error in fetch_personalized_recommendations: {e}", exc_info=True)
+        return []
+
+def rank_candidates(products, data, recent_departments):
+    """Personalise, content-filter and format already filtered candidate products"""
+    try:
+        limit = data.get("limit", 15)
+
+        # Apply personalization based on user preferences if available
+        user_id = data.get('user_id')
+        if user_id and user_id in user_preferences and not products.empty:
+            # Score products based on learned preferences
+            scores = calculate_preference_scores(products, user_id)
+            # Content filtering re-ranks the full list; otherwise only the top `limit` matter
+            if recent_departments:
+                order = np.argsort(-scores, kind='stable')
+            else:
+                order = top_k_order(scores, limit)
+            products = products.iloc[order].assign(preference_score=scores[order])
+
         # Apply content-based filtering if recent_departments is provided
         if recent_departments:
             logging.info(f"Applying content-based filtering for departments: {recent_departments}")
-            final_recommendations = content_based_filtering(recent_departments, unique_recommended_products, limit)
+            final_recommendations = content_based_filtering(recent_departments, products, limit)
         else:
-            final_recommendations = unique_recommended_products.head(limit)
+            final_recommendations = products.head(limit)
 
-        # Prepare the response
+        # Prepare the response; strings come from the catalogue arrays by row
+        catalogue = current_catalogue()['catalogue']
         recommendations = []
-        for _, row in final_recommendations.iterrows():
+        for row_number, row in final_recommendations.iterrows():
             recommendations.append({
-                "Product Name": row.get("title", "Unknown Product"),
-                "department": row.get("department", "Unknown Department"),
-                "images": row.get("images", ""),
-                "url": row.get("url", ""),
-                "price": float(row.get("final_price", 0.0)) if pd.notna(row.get("final_price")) else 0.0,
-                "Rating": float(row.get("rating", 0.0)) if pd.notna(row.get("rating")) else 0.0,
-                "Popularity": row.get("reviews_count", 0.0) if pd.notna(row.get("reviews_count")) else 0,
+                "Product Name": catalogue.title[row_number],
+                "department": row["department"],
+                "images": catalogue.images[row_number],
+                "url": catalogue.url[row_number],
+                "price": float(row["final_price"]),
+                "Rating": float(row["rating"]),
+                "Popularity": float(row["reviews_count"]),
                 "similarity_score": float(row.get("similarity_score", 0.0)) if "similarity_score" in row else 0.0,
             })
 
         return recommendations
 
     except Exception as e:
-        logging.error(f"Error in fetch_personalized_recommendations: {e}", exc_info=True)
+        logging.error(f"Error in rank_candidates: {e}", exc_info=True)
         return []
 
-def content_based_filtering(recent_departments, amazon_df, limit=15):
+def content_based_filtering(recent_departments, products, limit=15):
     try:
         logging.info(f"Applying content-based filtering for departments: {recent_departments}")
 
-        # Ensure categories are lists
-        amazon_df['categories'] = amazon_df['categories'].apply(lambda x: x if isinstance(x, list) else [])
-
         # Filter products where at least one category matches recent_departments
-        filtered_df = amazon_df[
-            amazon_df['categories'].apply(lambda cats: any(dep in cats for dep in recent_departments))
-        ].copy()  # Use .copy() to avoid SettingWithCopyWarning
+        content_index = current_catalogue()['content_index']
+        category_rows = content_index.rows_in_categories(recent_departments)
+        filtered_df = products[products.index.isin(category_rows)]
 
         if filtered_df.empty:
             logging.warning("No products matched recent_departments categories.")
-            return amazon_df.sample(limit)  # Fallback: return random products
+            return products.sample(min(limit, len(products)))  # Fallback: return random products
 
-        # Content-Based Filtering (TF-IDF)
+        # Content-Based Filtering (TF-IDF) against the precomputed term counts
         user_query = " ".join(recent_departments)
-        vectorizer = TfidfVectorizer(stop_words='english')
-
-        # Fill missing features with empty strings
-        filtered_df.loc[:, 'features'] = filtered_df['features'].fillna('')
-
-        # Convert features (lists) to strings
-        filtered_df.loc[:, 'features'] = filtered_df['features'].apply(lambda x: " ".join(x) if isinstance(x, list) else x)
-
-        # Fit TF-IDF on features
-        tfidf_matrix = vectorizer.fit_transform(filtered_df['features'])
-
-        # Transform user query
-        user_query_vector = vectorizer.transform([user_query])
-        similarity_scores = cosine_similarity(user_query_vector, tfidf_matrix).flatten()
-
-        # Add similarity scores to the DataFrame
-        filtered_df = filtered_df.copy()  # Avoid modifying the original DataFrame
-        filtered_df.loc[:, 'similarity_score'] = similarity_scores
+        similarity_scores = content_index.score(user_query, filtered_df.index.to_numpy())
 
         # Sort by similarity and return top products
-        recommended_products = filtered_df.sort_values(by='similarity_score', ascending=False).head(limit)
-        return recommended_products
+        recommended_products = filtered_df.assign(similarity_score=similarity_scores)
+        return recommended_products.sort_values(by='similarity_score', ascending=False).head(limit)
 
     except Exception as e:
         logging.error(f"Error in content_based_filtering: {e}")
         raise
 
-def get_price_range(price):
-    if price < 50:
-        return "0-50"
-    elif 50 <= price < 100:
-        return "50-100"
-    else:
-        return "100+"
-    
 @app.route('/update_likes', methods=['POST'])
 def update_likes():
     try:
@@ -786,18 +989,26 @@ def more_related():
         if not all([department, bs_category, product_name]):
             return jsonify({"error": "Missing required parameters"}), 400
 
-        amazon_df_clean = amazon_df.copy()
+        cache_key = ('more_related', normalise_params({
+            "department": department, "bs_category": bs_category,
+            "product_name": product_name, "user_id": user_id,
+        }), user_preference_versions.get(user_id, 0), catalogue_version_id())
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
+        state = current_catalogue()
+        amazon_df, catalogue = state['amazon_df'], state['catalogue']
+        current_rows = catalogue.rows_for_title(product_name)
+        excluded_rows = set(current_rows)
 
         # --- Strict filtering for bs_category (same department) ---
-        filtered_products_strict = amazon_df_clean[
-            (amazon_df_clean['department'] == department) & 
-            (amazon_df_clean['title'] != product_name)
-        ].copy()
+        filtered_products_strict = amazon_df.iloc[[
+            row for row in catalogue.rows_for_department(department) if row not in excluded_rows
+        ]]
 
         # --- Loose filtering for semantic + collaborative ---
-        filtered_products_loose = amazon_df_clean[
-            amazon_df_clean['title'] != product_name
-        ].copy()
+        filtered_products_loose = amazon_df.drop(index=current_rows)
 
         if filtered_products_loose.empty:
             return jsonify({"error": "No products found"}), 404
@@ -805,7 +1016,7 @@ def more_related():
         # --- Part 1: Get bs_category matches (strict) ---
         bs_category_products = filtered_products_strict[
             filtered_products_strict['bs_category'] == bs_category
-        ].copy()
+        ]
 
         bs_category_results = bs_category_products.sample(
             n=min(6, len(bs_category_products)),
@@ -815,30 +1026,28 @@ def more_related():
         # --- Part 2: Get semantic similarity matches (loose) ---
         remaining_products = filtered_products_loose[
             ~filtered_products_loose.index.isin(bs_category_results.index)
-        ].copy()
+        ]
 
         desc_results = pd.DataFrame()
-        if not remaining_products.empty and model is not None:
+        if not remaining_products.empty and state['vector_index'] is not None:
             try:
-                current_product = amazon_df_clean[amazon_df_clean['title'] == product_name].iloc[0]
-                current_embedding = current_product.get('embedding')
+                index = ensure_vector_index(state)
+                current_embedding = index.vector_for(current_rows[0]) if len(current_rows) else None
 
                 if current_embedding is not None:
-                    remaining_embeddings = np.stack(
-                        remaining_products['embedding'].apply(
-                            lambda x: x if x is not None else np.zeros_like(current_embedding)
-                        ).values
+                    excluded = excluded_rows | set(bs_category_results.index)
+                    # Over-fetch so the department boost can reorder the neighbours
+                    neighbour_ids, scores = index.search(
+                        current_embedding,
+                        k=semantic_limit * 4,
+                        exclude=excluded
                     )
-                    similarities = cosine_similarity([current_embedding], remaining_embeddings).flatten()
-                    
-                    remaining_products = remaining_products.assign(similarity=similarities)
+                    neighbours = amazon_df.loc[neighbour_ids].assign(similarity=scores)
 
                     # Optional weighting based on department match
-                    remaining_products['similarity'] *= remaining_products['department'].apply(
-                        lambda d: 1.1 if d == department else 1.0
-                    )
+                    neighbours['similarity'] *= np.where(neighbours['department'] == department, 1.1, 1.0)
 
-                    desc_results = remaining_products.nlargest(semantic_limit, 'similarity')
+                    desc_results = neighbours.nlargest(semantic_limit, 'similarity')
                     desc_results['match_type'] = 'semantic'
             except Exception as e:
                 logging.error(f"Error in similarity calculation: {e}")
@@ -856,14 +1065,18 @@ def more_related():
             try:
                 collab_recs = collaborative_recommendations(user_id, top_n=collab_limit)
                 if collab_recs:
-                    recommended_titles = [rec[0] for rec in collab_recs]
+                    # Keyed by asin_id (the asin's first row), like the frame
+                    rec_scores = {}
+                    for asin, score in collab_recs:
+                        row = catalogue.row_for_asin(asin)
+                        if row is not None:
+                            rec_scores[row] = score
                     collab_results = filtered_products_loose[
-                        filtered_products_loose['title'].isin(recommended_titles)
+                        filtered_products_loose['asin_id'].isin(list(rec_scores))
                     ].copy()
 
                     collab_results['match_type'] = 'collaborative'
-                    rec_scores = {rec[0]: rec[1] for rec in collab_recs}
-                    collab_results['similarity'] = collab_results['title'].map(rec_scores)
+                    collab_results['similarity'] = collab_results['asin_id'].map(rec_scores)
 
                     collab_results = collab_results[
                         ~collab_results.index.isin(desc_results.index) & 
@@ -894,20 +1107,20 @@ def more_related():
 
         # Prepare JSON response
         products_list = []
-        for _, row in final_results.iterrows():
+        for row_number, row in final_results.iterrows():
             products_list.append({
-                "Product Name": row.get("title", "Unknown"),
-                "department": row.get("department", "Unknown"),
-                "bs_category": row.get("bs_category", "Unknown"),
-                "images": row.get("images", ""),
-                "url": row.get("url", ""),
-                "price": float(row.get("price", 0)) if pd.notna(row.get("price")) else 0,
-                "Rating": float(row.get("rating", 0)) if pd.notna(row.get("rating")) else 0,
+                "Product Name": catalogue.title[row_number],
+                "department": row["department"],
+                "bs_category": row["bs_category"],
+                "images": catalogue.images[row_number],
+                "url": catalogue.url[row_number],
+                "price": float(row["final_price"]),
+                "Rating": float(row["rating"]),
                 "similarity_score": float(row.get("similarity", 0)) if pd.notna(row.get("similarity")) else 0,
                 "match_type": row.get("match_type", "unknown"),
             })
 
-        return jsonify({
+        response = {
             "filtered_products": products_list,
             "stats": {
                 "total_products": len(final_results),
@@ -915,7 +1128,9 @@ def more_related():
                 "semantic_matches": len(desc_results),
                 "collaborative_matches": len(collab_results),
             }
-        })
+        }
+        result_cache.put(cache_key, response, user_id)
+        return jsonify(response)
 
     except Exception as e:
         logging.error(f"Error in more_related: {str(e)}", exc_info=True)
@@ -923,9 +1138,18 @@ def more_related():
 
 user_click_counts = defaultdict(lambda: defaultdict(int))
   
+FCM_URL = os.environ.get('FCM_URL', FCM_LEGACY_URL)
+# Notifications are disabled unless a server key is configured
+FCM_SERVER_KEY = os.environ.get('FCM_SERVER_KEY')
+NOTIFICATION_WAIT_TIMEOUT = 15  # seconds, only for callers that ask to wait
+
+# FCM requests go out from an asyncio loop (started by init_resources), not request threads
+notification_dispatcher = NotificationDispatcher(FCM_URL, FCM_SERVER_KEY)
+
 # allow device to receive notifications for the calendar special events
 @app.route('/send-notification', methods=['POST'])
 def send_notification():
+    """Queue a notification (202); with "wait": true, relay FCM's response instead"""
     try:
         data = request.json
         token = data.get('token')
@@ -934,36 +1158,66 @@ def send_notification():
 
         if not token or not title or not body:
             return jsonify({'error': 'Missing parameters'}), 400
+        if not FCM_SERVER_KEY:
+            return jsonify({'error': 'Notifications are not configured'}), 503
 
-        server_key = 'fqp701otSZ-phpTGxB2N5e:APA91bF4u5MYXsqng0RhdsfEqU8DHTu_vz4O4tzD3Kmbgc5qo6c2ev49qmamYSzANU_yofk3t5THH4HMjQBBx6nO7mAlnqaXQi9XceWmwqQd63-GDDh_5Ls'
-        url = 'https://fcm.googleapis.com/fcm/send'
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'key={server_key}',
-        }
-        payload = {
-            'to': token,
-            'notification': {
-                'title': title,
-                'body': body,
-            },
-        }
+        try:
+            future = notification_dispatcher.send(token, title, body)
+        except queue.Full:
+            return jsonify({'error': 'Notification queue is full'}), 503
+        logging.info(f"Queued notification to token: {token}")
+
+        if not data.get('wait'):
+            return jsonify({'status': 'queued'}), 202
+
+        # Drop the catalogue pin first so a retired version isn't kept alive waiting on FCM
+        release_catalogue(None)
+        result = future.result(timeout=NOTIFICATION_WAIT_TIMEOUT)
+        logging.info(f"FCM Response: {result['status']} after {result['attempts']} attempt(s)")
+        if result['status'] == 200:
+            return jsonify(result['body']), 200
+        else:
+            return jsonify({'error': 'Failed to send notification'}), result['status']
+
+    except TimeoutError:
+        return jsonify({'error': 'Timed out waiting for FCM'}), 504
+    except Exception as e:
+        logging.error(f"Error sending notification: {e}")
+        return jsonify({'error': str(e)}), 500
 
-        print(f"Sending notification to token: {token}")
-        print(f"Payload: {payload}")
+@app.route('/send-notifications', methods=['POST'])
+def send_notifications():
+    """Queue one notification for many tokens, batched into as few FCM requests as possible"""
+    try:
+        data = request.json
+        tokens = data.get('tokens')
+        title = data.get('title')
+        body = data.get('body')
 
-        response = requests.post(url, headers=headers, json=payload)
-        print(f"FCM Response: {response.status_code}, {response.text}")
+        if not tokens or not isinstance(tokens, list) or not title or not body:
+            return jsonify({'error': 'Missing parameters'}), 400
+        if not FCM_SERVER_KEY:
+            return jsonify({'error': 'Notifications are not configured'}), 503
 
-        if response.status_code == 200:
-            return jsonify(response.json()), 200
-        else:
-            return jsonify({'error': 'Failed to send notification'}), response.status_code
+        futures = notification_dispatcher.send_many(tokens, title, body)
+        rejected = sum(1 for f in futures if f.done() and isinstance(f.exception(), queue.Full))
+        if rejected == len(futures):
+            return jsonify({'error': 'Notification queue is full'}), 503
+        return jsonify({
+            'status': 'queued',
+            'tokens': len(set(tokens)),
+            'requests': len(futures) - rejected,
+            'rejected_requests': rejected,
+        }), 202
 
     except Exception as e:
-        print(f"Error sending notification: {e}")
+        logging.error(f"Error sending notifications: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/notification_stats')
+def notification_stats():
+    return jsonify(notification_dispatcher.stats())
+
 interaction_log = [] 
 user_profiles = defaultdict(lambda: {
     'department_affinity': defaultdict(float),
@@ -972,11 +1226,13 @@ user_profiles = defaultdict(lambda: {
     'last_active': None
 })
 
-user_interactions = defaultdict(dict)  
-item_popularity = defaultdict(int)    
+# Keeps the preference model's queue in log order, so a checkpoint knows
+# exactly which logged events the model has seen
+feedback_lock = threading.Lock()
 
-def track_interaction(data):
-    """Log interactions to CSV for analysis"""
+def track_interaction(data, feedback_text=None):
+    """Log interactions to CSV for analysis; feedback_text also goes to the preference model"""
+    global item_events_since_save, latent_events_since_fit
     required_fields = ['user_id', 'product_id', 'interaction_type']
     
     if not all(field in data for field in required_fields):
@@ -984,16 +1240,23 @@ def track_interaction(data):
         return False
     
     try:
-        with open('interactions_log.csv', 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=required_fields + ['timestamp'])
-            if f.tell() == 0:
-                writer.writeheader()
-            writer.writerow({
+        with feedback_lock:
+            log_row = interaction_writer.write({
                 'user_id': data['user_id'],
                 'product_id': data['product_id'],
                 'interaction_type': data['interaction_type'],
                 'timestamp': data.get('timestamp', datetime.now().isoformat())
             })
+            if feedback_text is not None:
+                preference_model.learn_from_feedback(
+                    feedback_text, liked=data['interaction_type'] == 'like', log_row=log_row
+                )
+
+        # Keep the item-item neighbour table current; it is saved in the background
+        item_neighbours.add(data['user_id'], data['product_id'], data['interaction_type'])
+        with interaction_counts_lock:
+            item_events_since_save += 1
+            latent_events_since_fit += 1
         return True
     except Exception as e:
         logging.error(f"Failed to track interaction: {e}")
@@ -1050,11 +1313,12 @@ def calculate_coverage():
     Calculate what percentage of items can be recommended
     Coverage = (# of recommendable items) / (total # of items)
     """
-    all_items = set(amazon_df['asin'].unique())
+    catalogue = current_catalogue()['catalogue']
+    total_items = len(catalogue.unique_rows) if catalogue is not None else 0
     try:
         # This depends on your model implementation
         recommendable_items = preference_model.get_recommendable_items()
-        return len(recommendable_items) / len(all_items) if all_items else 0.0
+        return len(recommendable_items) / total_items if total_items else 0.0
     except Exception as e:
         logging.error(f"Error calculating coverage: {e}")
         return 0.0
@@ -1076,17 +1340,18 @@ def calculate_diversity(sample_size=100):
             return 0.0
             
         # Get item embeddings or features
+        catalogue = current_catalogue()['catalogue']
         item_features = []
         for item in set(sample_recommendations):
-            product = amazon_df[amazon_df['asin'] == item].iloc[0]
-            features = " ".join(product.get('features', []))
-            text = f"{product['title']} {features} {product.get('department', '')}"
-            item_features.append(text)
+            text = catalogue.text(item)
+            if text is not None:
+                item_features.append(text)
         
         # Use TF-IDF or your model's feature representation
         tfidf_matrix = preference_model.vectorizer.transform(item_features)
         
         # Calculate pairwise cosine distances
+        from sklearn.metrics.pairwise import pairwise_distances
         distances = pairwise_distances(tfidf_matrix, metric='cosine')
         np.fill_diagonal(distances, 0)  # Ignore self-similarity
         
@@ -1131,12 +1396,13 @@ def find_common_features(preference_type):
     Find most common features among liked/disliked items
     """
     feature_counts = defaultdict(int)
+    catalogue = current_catalogue()['catalogue']
     
     for user_id, prefs in user_preferences.items():
         for product_id in prefs.get(preference_type, []):
             try:
-                product = amazon_df[amazon_df['asin'] == product_id].iloc[0]
-                for feature in product.get('features', []):
+                product = catalogue.product(product_id)
+                for feature in product['features']:
                     feature_counts[feature] += 1
             except:
                 continue
@@ -1165,11 +1431,7 @@ def model_metrics():
         return jsonify({
             "status": "success",
             "metrics": metrics,
-            "model_status": {
-                "is_trained": preference_model.is_trained,
-                "last_trained": preference_model.last_trained_time,
-                "training_samples": preference_model.training_samples
-            }
+            "model_status": preference_model.status()
         })
         
     except Exception as e:
@@ -1179,6 +1441,11 @@ def model_metrics():
             "message": str(e)
         }), 500
 
+@app.route('/cache_stats')
+def cache_stats():
+    """Hit rate and size of the recommendation result cache"""
+    return jsonify({"status": "success", "result_cache": result_cache.stats()})
+
 @app.route('/user_metrics/<user_id>')
 def user_metrics(user_id):
     """User-specific recommendation metrics"""
@@ -1214,48 +1481,299 @@ def user_metrics(user_id):
             "message": str(e)
         }), 500
             
+CHECKPOINT_FORMAT_VERSION = 2
+PREDICTION_CACHE_DEPTH = 50
+PREDICTION_CACHE_USERS = 10000
+
+class PublishedModel:
+    """Immutable classifier snapshot that requests score against.
+
+    `log_row` is the interaction log row number of the last feedback it
+    was trained on (None when it holds only warm-start or replayed samples).
+    """
+
+    def __init__(self, classifier, version, training_samples, log_row=None):
+        self.classifier = classifier
+        self.version = version
+        self.training_samples = training_samples
+        self.log_row = log_row
+        self.trained_at = datetime.now().isoformat()
+
+
 class PreferenceModel:
-    def __init__(self):
-        self.model = make_pipeline(
-            TfidfVectorizer(max_features=5000),
-            PassiveAggressiveClassifier()
-        )
-        self.is_trained = False
-        self.vectorizer = None
-        self.classifier = None
-        self.X_train = []
-        self.y_train = []
+    """Online like/dislike classifier over product text.
+
+    Text is hashed (no fitted vocabulary) and feedback is applied with
+    partial_fit, so an update costs the same however much feedback came
+    before. Requests only enqueue feedback; a trainer thread applies it in
+    batches and publishes a copy of the classifier, which readers pick up
+    with a single attribute read. Only the last replay_size samples are
+    kept, for a catch-up pass once both labels have been seen.
+    """
+
+    def __init__(self, n_features=2 ** 18, replay_size=1000, max_batch=256):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.linear_model import SGDClassifier
+        self.vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False)
+        self.classes = np.array([0, 1])
+        self.replay_buffer = deque(maxlen=replay_size)
+        self.label_counts = [0, 0]
+        self.max_batch = max_batch
+        self.published = None
+        self.events_received = 0
+        # Log offset covered by the warm start (train_now / a loaded checkpoint)
+        self.log_offset = 0
+        # Passive-aggressive (PA-I) updates; PassiveAggressiveClassifier is deprecated
+        self._classifier = SGDClassifier(loss='hinge', penalty=None, learning_rate='pa1', eta0=1.0)
+        self._samples = 0
+        self._version = 0
+        self._log_row = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._prediction_cache = OrderedDict()
+        self._prediction_lock = threading.Lock()
+        # Request threads count feedback while the warm start may reset the count
+        self._events_lock = threading.Lock()
+
+    @property
+    def is_trained(self):
+        return self.published is not None
+
+    @property
+    def version(self):
+        published = self.published
+        return published.version if published else 0
+
+    @property
+    def training_samples(self):
+        published = self.published
+        return published.training_samples if published else 0
+
+    @property
+    def last_trained_time(self):
+        published = self.published
+        return published.trained_at if published else None
+
+    def start(self):
+        """Start the trainer thread (once)"""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='preference-trainer', daemon=True)
+                self._thread.start()
+        return self
         
-    def learn_from_feedback(self, text, liked=True):
-        """Update model with new feedback"""
+    def learn_from_feedback(self, text, liked=True, log_row=None):
+        """Queue a feedback sample for the trainer; never blocks on training.
+
+        `log_row` is the sample's interaction log row number; samples must
+        be queued in log order.
+        """
         try:
             # Convert text to string if it's not already
             text = str(text) if not isinstance(text, str) else text
-            
-            # Add to training data
-            self.X_train.append(text)
-            self.y_train.append(1 if liked else 0)
-            
-            # Retrain model periodically (every 10 samples for efficiency)
-            if len(self.X_train) % 10 == 0 or not self.is_trained:
-                if len(set(self.y_train)) >= 2:  # Need both positive and negative samples
-                    self.model.fit(self.X_train, self.y_train)
-                    self.is_trained = True
-                    logging.info(f"Model retrained with {len(self.X_train)} samples")
-            
+            with self._events_lock:
+                self.events_received += 1
+            self._queue.put((text, 1 if liked else 0, log_row))
+            self.start()
             return True
         except Exception as e:
             logging.error(f"Error in learn_from_feedback: {e}")
             return False
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            log_rows = [log_row for _, _, log_row in batch if log_row is not None]
+            try:
+                self._train([(text, label) for text, label, _ in batch], log_rows[-1] if log_rows else None)
+            except Exception as e:
+                logging.error(f"Preference model training failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _train(self, batch, log_row=None):
+        texts, labels = zip(*batch)
+        self.replay_buffer.extend(batch)
+        for label in labels:
+            self.label_counts[label] += 1
+        self._classifier.partial_fit(self.vectorizer.transform(texts), labels, classes=self.classes)
+        self._samples += len(batch)
+        if log_row is not None:
+            self._log_row = log_row
+
+        if not all(self.label_counts):
+            return
+        if self.published is None:
+            # The first updates only saw one label; replay them once both are known
+            replay_texts, replay_labels = zip(*self.replay_buffer)
+            self._classifier.partial_fit(self.vectorizer.transform(replay_texts), replay_labels, classes=self.classes)
+            logging.info(f"Preference model trained on {len(replay_texts)} buffered samples")
+        self._publish()
+
+    def _publish(self):
+        self._version += 1
+        self.published = PublishedModel(copy.deepcopy(self._classifier), self._version, self._samples, self._log_row)
+
+    def flush(self, timeout=None):
+        """Block until every queued sample has been trained and published"""
+        if self._thread is None:
+            return
+        if timeout is None:
+            self._queue.join()
+            return
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+    def train_now(self, samples):
+        """Train synchronously on (text, liked) pairs; used for warm start before start()"""
+        samples = [(text, 1 if liked else 0) for text, liked in samples]
+        with self._events_lock:
+            self.events_received += len(samples)
+        for i in range(0, len(samples), self.max_batch):
+            self._train(samples[i:i + self.max_batch])
+
+    def save_checkpoint(self, directory, log_offset, keep=3, published=None):
+        """Write a published model (the current one by default) and prune all but the newest `keep`.
+
+        File names carry a random suffix as well as the version, so
+        workers checkpointing into one directory never overwrite each other.
+        """
+        published = published or self.published
+        if published is None:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        state = {
+            'format_version': CHECKPOINT_FORMAT_VERSION,
+            'n_features': self.vectorizer.n_features,
+            'version': published.version,
+            'training_samples': published.training_samples,
+            'trained_at': published.trained_at,
+            'classifier': published.classifier,
+            'label_counts': list(self.label_counts),
+            'replay_buffer': list(self.replay_buffer),
+            'log_offset': log_offset,
+        }
+        path = os.path.join(directory, f"checkpoint-{published.version:08d}-{uuid.uuid4().hex[:8]}.pkl")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        for old_path in self._checkpoints_newest_first(directory)[keep:]:
+            try:
+                os.remove(old_path)
+            except OSError:
+                # Already pruned by another worker
+                pass
+        return path
+
+    @staticmethod
+    def _checkpoints_newest_first(directory):
+        paths = []
+        for path in glob.glob(os.path.join(directory, 'checkpoint-*.pkl')):
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        return [path for _, path in sorted(paths, reverse=True)]
+
+    def load_latest_checkpoint(self, directory):
+        """Restore the newest checkpoint before start(); returns its log offset (None if there is none)"""
+        for path in self._checkpoints_newest_first(directory):
+            try:
+                with open(path, 'rb') as f:
+                    state = pickle.load(f)
+                if state['format_version'] != CHECKPOINT_FORMAT_VERSION or state['n_features'] != self.vectorizer.n_features:
+                    logging.warning(f"Ignoring incompatible preference checkpoint {path}")
+                    continue
+            except Exception as e:
+                logging.error(f"Failed to read preference checkpoint {path}: {e}")
+                continue
+
+            self._classifier = copy.deepcopy(state['classifier'])
+            self._samples = state['training_samples']
+            self._version = state['version']
+            self.label_counts = state['label_counts']
+            self.replay_buffer.extend(state['replay_buffer'])
+            with self._events_lock:
+                self.events_received = self._samples
+            self.published = PublishedModel(state['classifier'], state['version'], state['training_samples'])
+            self.published.trained_at = state['trained_at']
+            self.log_offset = state['log_offset']
+            logging.info(f"Loaded preference model version {self._version} from {path}")
+            return state['log_offset']
+        return None
+
+    def status(self):
+        """Published version, its training samples and how far it lags the feedback"""
+        published = self.published
+        with self._events_lock:
+            events_received = self.events_received
+        return {
+            "is_trained": published is not None,
+            "version": published.version if published else 0,
+            "training_samples": published.training_samples if published else 0,
+            "last_trained": published.trained_at if published else None,
+            "lag": events_received - (published.training_samples if published else 0),
+        }
+
+    def decision_scores(self, texts):
+        """Signed distance from the like/dislike boundary for each text (0 until trained)"""
+        return self.decision_features(self.vectorizer.transform(texts))
+
+    def decision_features(self, features):
+        """decision_scores for rows already transformed with self.vectorizer"""
+        published = self.published
+        if published is None:
+            return np.zeros(features.shape[0])
+        return published.classifier.decision_function(features)
             
     def predict_preference(self, user_id, k=5):
-        """Temporary implementation for testing"""
-        if not hasattr(self, 'dummy_items'):
-            # Get top popular items as fallback
-            self.dummy_items = amazon_df['asin'].value_counts().index[:100].tolist()
-        
-        # Return random items from dummy pool (replace with real logic)
-        return random.sample(self.dummy_items, min(k, len(self.dummy_items)))
+        """Top-k asins for a user, cached until that user's likes/dislikes change"""
+        # Rankings name rows of the pinned catalogue version
+        version = (user_preference_versions.get(user_id, 0), catalogue_version_id())
+        with self._prediction_lock:
+            cached = self._prediction_cache.get(user_id)
+            if cached is not None and cached[0] == version and len(cached[1]) >= k:
+                self._prediction_cache.move_to_end(user_id)
+                return cached[1][:k]
+
+        recs = rank_user_candidates(user_id, max(k, PREDICTION_CACHE_DEPTH))
+        with self._prediction_lock:
+            self._prediction_cache[user_id] = (version, recs)
+            self._prediction_cache.move_to_end(user_id)
+            while len(self._prediction_cache) > PREDICTION_CACHE_USERS:
+                self._prediction_cache.popitem(last=False)
+        return recs[:k]
+
+    def clear_predictions(self):
+        with self._prediction_lock:
+            self._prediction_cache.clear()
+
+    def get_recommendable_items(self):
+        """Asins predict_preference can return"""
+        catalogue = current_catalogue()['catalogue']
+        items = set(catalogue.asin.take(ensure_candidate_pool()[0]))
+        model = latent_model
+        if model is not None:
+            known = catalogue.asin_rows(model.item_ids) >= 0
+            items.update(asin for asin, keep in zip(model.item_ids, known) if keep)
+        return items
+
+    def get_similar_users(self, user_id, n=10):
+        """(user_id, cosine) of the users closest in latent factor space"""
+        model = latent_model
+        if model is None:
+            return []
+        return model.similar_users(user_id, n, ratings=item_neighbours.user_ratings(user_id))
 
 def calculate_precision_at_k(user_id, k=5):
     liked = user_preferences.get(user_id, {}).get('likes', [])
@@ -1279,7 +1797,394 @@ def debug_user(user_id):
         ]
     })
 
-preference_model = PreferenceModel()
+PREFERENCE_CHECKPOINT_DIR = os.path.join(BASE_DIR, 'preference_checkpoints')
+PREFERENCE_CHECKPOINT_INTERVAL = 300  # seconds
+PREFERENCE_CHECKPOINTS_KEPT = 3
+
+def warm_start_preference_model(model):
+    """Newest checkpoint plus the feedback logged after it"""
+    offset = model.load_latest_checkpoint(PREFERENCE_CHECKPOINT_DIR) or 0
+    rows, end_offset = read_interactions(INTERACTIONS_LOG_PATH, offset)
+    catalogue = current_catalogue()['catalogue']
+    samples = []
+    for row in rows:
+        text = catalogue.text(row['product_id']) if catalogue is not None else None
+        if text is not None and row['interaction_type'] in ('like', 'dislike'):
+            samples.append((text, row['interaction_type'] == 'like'))
+    model.train_now(samples)
+    model.log_offset = end_offset
+    logging.info(f"Preference model warm start: version {model.version}, {len(samples)} logged samples replayed")
+    return model
+
+def save_preference_checkpoint():
+    """Checkpoint the published preference model with the log offset of the last event it trained on"""
+    try:
+        # Let feedback that is already queued make it in
+        preference_model.flush(timeout=5)
+        published = preference_model.published
+        if published is None:
+            return
+        if published.log_row is None:
+            offset = preference_model.log_offset
+        else:
+            # The row may still be queued for the log
+            interaction_writer.flush()
+            offset = interaction_writer.offset_for(published.log_row)
+            if offset is None:
+                logging.warning(f"Log offset of row {published.log_row} unknown, skipping preference checkpoint")
+                return
+        path = preference_model.save_checkpoint(
+            PREFERENCE_CHECKPOINT_DIR, offset, PREFERENCE_CHECKPOINTS_KEPT, published=published
+        )
+        if path:
+            logging.info(f"Saved preference model checkpoint {path}")
+    except Exception as e:
+        logging.error(f"Failed to save preference checkpoint: {e}")
+
+def run_preference_checkpoints():
+    last_version = preference_model.version
+    while True:
+        time.sleep(PREFERENCE_CHECKPOINT_INTERVAL)
+        if preference_model.version != last_version:
+            save_preference_checkpoint()
+            last_version = preference_model.version
+
+preference_model = None
+
+def empty_catalogue_state():
+    """Catalogue state with nothing loaded; build_catalogue_version fills in what it can"""
+    return {
+        'catalogue_sources': None, 'df': pd.DataFrame(), 'amazon_df': pd.DataFrame(),
+        'embedding_store': None, 'shared_store': None, 'vector_index': None,
+        'department_buckets': {}, 'trending_index': None, 'catalogue': None,
+        'content_index': None, 'gift_index': None, 'fallback_rows': np.array([], dtype=np.int64),
+        'catalogue_features': None, 'candidate_pool_rows': None, 'catalogue_popularity': None,
+    }
+
+# What readers see before the first version has loaded
+EMPTY_CATALOGUE = empty_catalogue_state()
+
+def build_catalogue_version(attach_shared=True):
+    """State of a new catalogue version: datasets, embeddings and everything derived from them.
+
+    Nothing live is touched; a failed index is logged and left empty, but
+    failing to read the datasets raises so the current version stays. With
+    SHARED_CATALOGUE_DIR set (and attach_shared), the version the loader
+    published is mapped instead, and built locally only until there is one.
+    """
+    serving_shared = attach_shared and SHARED_CATALOGUE_DIR is not None
+    state = empty_catalogue_state()
+    state['catalogue_sources'] = catalogue_source_stamp()
+    if serving_shared:
+        try:
+            shared_state = attach_shared_catalogue()
+            if shared_state is not None:
+                state.update(shared_state)
+                return state
+        except Exception as e:
+            logging.error(f"Failed to attach shared catalogue, building locally: {e}")
+
+    store = EmbeddingStore(EMBEDDING_STORE_PATH)
+    # Shared-mode workers leave encoding to the loader
+    gift_df, frame = load_datasets(store, encode_missing=not serving_shared)
+    state.update({'df': gift_df, 'embedding_store': store})
+    # Only the arrays are kept; the loaded frame is dropped once everything is built
+    if not frame.empty:
+        catalogue = Catalogue(frame)
+        state.update({
+            'catalogue': catalogue,
+            'amazon_df': catalogue.frame(),
+            'department_buckets': catalogue.department.groups,
+        })
+
+    try:
+        if store.matrix is not None and not frame.empty:
+            state['vector_index'] = build_vector_index(frame, store)
+    except Exception as e:
+        logging.error(f"Failed to build vector index: {e}")
+
+    try:
+        if not frame.empty:
+            state['trending_index'] = build_trending_index(frame)
+    except Exception as e:
+        logging.error(f"Failed to build trending index: {e}")
+
+    try:
+        if not frame.empty:
+            state['content_index'] = load_content_index(frame)
+    except Exception as e:
+        logging.error(f"Failed to build content index: {e}")
+
+    try:
+        if not gift_df.empty:
+            state['gift_index'] = GiftProfileIndex(gift_df, interest_to_department, frame['department'].to_numpy() if not frame.empty else [])
+    except Exception as e:
+        logging.error(f"Failed to build gift profile index: {e}")
+
+    try:
+        if state['gift_index'] is not None and state['catalogue'] is not None:
+            state['fallback_rows'] = build_fallback_rows(state['gift_index'], state['catalogue'])
+    except Exception as e:
+        logging.error(f"Failed to build fallback candidates: {e}")
+
+    # Warm the per-row ranking inputs so the first requests on the new version don't pay for them
+    try:
+        if state['catalogue'] is not None:
+            state['candidate_pool_rows'], state['catalogue_popularity'] = build_candidate_pool(state['catalogue'])
+        if preference_model is not None and not frame.empty:
+            state['catalogue_features'] = preference_model.vectorizer.transform(frame['text'])
+    except Exception as e:
+        logging.error(f"Failed to build candidate pool: {e}")
+    return state
+
+def shared_catalogue_arrays(state):
+    """Arrays of a built version that workers map instead of building anything per product, and their meta"""
+    arrays = {}
+    meta = {'rows': len(state['catalogue'])}
+    for name in ('catalogue', 'vector_index', 'trending_index', 'content_index'):
+        if state[name] is not None:
+            index_arrays, meta[name] = state[name].to_arrays()
+            arrays.update({f"{name}__{key}": value for key, value in index_arrays.items()})
+    if state['gift_index'] is not None:
+        meta['interest_rows'], arrays['interest_rows__bounds'], arrays['interest_rows__rows'] = pack_groups(state['gift_index'].interest_rows)
+    arrays['fallback_rows'] = state['fallback_rows']
+    if state['candidate_pool_rows'] is not None:
+        arrays['candidate_pool_rows'] = state['candidate_pool_rows']
+        arrays['catalogue_popularity'] = state['catalogue_popularity']
+    features = state['catalogue_features']
+    if features is not None:
+        arrays.update({
+            'catalogue_features__data': features.data,
+            'catalogue_features__indices': features.indices,
+            'catalogue_features__indptr': features.indptr,
+        })
+        meta['catalogue_features'] = {'shape': list(features.shape)}
+    return arrays, meta
+
+def attach_shared_catalogue():
+    """State mapped read-only from the published arrays, or None if nothing usable is published.
+
+    Apart from dataset.csv (for the gift profile bitsets) nothing is read
+    or built per product: strings, lookups and indexes are all mapped.
+    """
+    shared = SharedArrayStore(SHARED_CATALOGUE_DIR)
+    if not shared.exists():
+        logging.warning(f"Nothing published in {SHARED_CATALOGUE_DIR} yet, building catalogue locally")
+        return None
+    shared.open()
+    meta, arrays = shared.meta, shared.arrays
+    if 'catalogue' not in meta:
+        logging.warning("Published catalogue arrays are from an older loader, building locally")
+        return None
+
+    def prefixed(prefix):
+        return {key[len(prefix):]: value for key, value in arrays.items() if key.startswith(prefix)}
+
+    catalogue = Catalogue.from_arrays(prefixed('catalogue__'), meta['catalogue'])
+    gift_df = pd.read_csv(DATASET_PATH)
+    state = {
+        'shared_store': shared,
+        'df': gift_df,
+        'catalogue': catalogue,
+        'amazon_df': catalogue.frame(),
+        'department_buckets': catalogue.department.groups,
+        'fallback_rows': arrays['fallback_rows'],
+    }
+    if 'vector_index' in meta:
+        state['vector_index'] = VectorIndex.from_arrays(prefixed('vector_index__'), meta['vector_index'])
+    if 'trending_index' in meta:
+        state['trending_index'] = TrendingIndex.from_arrays(
+            prefixed('trending_index__'), meta['trending_index'], source=id(catalogue)
+        )
+    if 'content_index' in meta:
+        from content_index import ContentIndex
+        state['content_index'] = ContentIndex.from_arrays(prefixed('content_index__'), meta['content_index'])
+    if 'interest_rows' in meta:
+        try:
+            state['gift_index'] = GiftProfileIndex(gift_df, interest_to_department, interest_rows=unpack_groups(
+                meta['interest_rows'], arrays['interest_rows__bounds'], arrays['interest_rows__rows']
+            ))
+        except Exception as e:
+            logging.error(f"Failed to build gift profile index: {e}")
+    if 'candidate_pool_rows' in arrays:
+        state['candidate_pool_rows'] = arrays['candidate_pool_rows']
+        state['catalogue_popularity'] = arrays['catalogue_popularity']
+    if 'catalogue_features' in meta:
+        from scipy.sparse import csr_matrix
+        features = prefixed('catalogue_features__')
+        state['catalogue_features'] = csr_matrix(
+            (features['data'], features['indices'], features['indptr']),
+            shape=tuple(meta['catalogue_features']['shape']), copy=False
+        )
+    logging.info(f"Attached shared catalogue arrays version {shared.version}")
+    return state
+
+def publish_shared_catalogue():
+    """Build a catalogue version in this process and publish its arrays to SHARED_CATALOGUE_DIR"""
+    state = build_catalogue_version(attach_shared=False)
+    if state['catalogue'] is None:
+        raise ValueError("Catalogue is empty, nothing to publish")
+    if state['catalogue_features'] is None:
+        # Same stateless hashing the workers' preference model uses
+        state['catalogue_features'] = PreferenceModel().vectorizer.transform(state['catalogue'].texts())
+    arrays, meta = shared_catalogue_arrays(state)
+    return SharedArrayStore(SHARED_CATALOGUE_DIR).publish(arrays, meta)
+
+def after_catalogue_swap(state):
+    """Drop results of the previous version and refit latent factors for the new one"""
+    # Keys carry the version id, so this only frees memory early
+    result_cache.clear()
+    if preference_model is not None:
+        preference_model.clear_predictions()
+    # New and changed products need latent factors too
+    if latent_model is not None:
+        try:
+            refit_latent_factors(state)
+        except Exception as e:
+            logging.error(f"Latent factor refit failed: {e}")
+
+catalogue_manager = CatalogueManager(build_catalogue_version, after_swap=after_catalogue_swap)
+CATALOGUE_POLL_INTERVAL = 60  # seconds
+
+def pinned_catalogue_version():
+    """Catalogue version this request pinned, or the live one outside a request"""
+    if has_request_context() and 'catalogue_version' in g:
+        return g.catalogue_version
+    return catalogue_manager.current
 
-if __name__ == '__main__':    
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+def current_catalogue():
+    """State of the pinned catalogue version (EMPTY_CATALOGUE before the first load).
+
+    Within a request every call returns the same version, however many
+    reloads happen meanwhile. Background jobs call it once per run and
+    keep what they got, so they never mix two versions either.
+    """
+    version = pinned_catalogue_version()
+    return version.state if version is not None else EMPTY_CATALOGUE
+
+def catalogue_version_id():
+    version = pinned_catalogue_version()
+    return version.version_id if version is not None else None
+
+def run_catalogue_polls():
+    """Reload the catalogue when any of its source files changes"""
+    while True:
+        time.sleep(CATALOGUE_POLL_INTERVAL)
+        catalogue_sources = current_catalogue()['catalogue_sources']
+        if catalogue_sources is not None and catalogue_source_stamp() != catalogue_sources:
+            if catalogue_manager.reload():
+                logging.info("Catalogue sources changed on disk, reloading")
+
+resources_ready = False
+resources_lock = threading.Lock()
+resources_load_seconds = None
+
+def init_resources():
+    """Load datasets, embeddings, indexes and models and start the background threads.
+
+    Runs once per process, on the first request or from the warm-up thread;
+    concurrent callers wait for the first one to finish. Threads and exit
+    hooks start only once everything has loaded, so a failed load can be
+    retried without leaving a set behind from the attempt before.
+    """
+    global resources_ready, resources_load_seconds, interaction_writer, item_neighbours, preference_model
+    if resources_ready:
+        return
+    with resources_lock:
+        if resources_ready:
+            return
+        start = time.time()
+        load_user_preferences()
+        item_neighbours = load_item_neighbours()
+
+        try:
+            catalogue_manager.load()
+        except Exception as e:
+            logging.error(f"Data loading failed: {e}")
+
+        warm_model = PreferenceModel()
+        try:
+            warm_start_preference_model(warm_model)
+        except Exception as e:
+            logging.error(f"Preference model warm start failed: {e}")
+
+        # Everything loaded; nothing below is retried
+        interaction_writer = InteractionLogWriter(INTERACTIONS_LOG_PATH)
+        atexit.register(interaction_writer.close)
+        threading.Thread(target=run_preference_snapshots, name='preference-snapshots', daemon=True).start()
+        atexit.register(save_user_preferences)
+        threading.Thread(target=run_item_neighbour_saves, name='item-neighbour-saves', daemon=True).start()
+        atexit.register(save_item_neighbours)
+
+        if FCM_SERVER_KEY:
+            try:
+                notification_dispatcher.start()
+                atexit.register(notification_dispatcher.stop)
+            except Exception as e:
+                logging.error(f"Failed to start notification dispatcher: {e}")
+        else:
+            logging.warning("FCM_SERVER_KEY is not set, notifications are disabled")
+
+        threading.Thread(target=run_catalogue_polls, name='catalogue-polls', daemon=True).start()
+        threading.Thread(target=run_latent_refits, name='latent-refits', daemon=True).start()
+
+        preference_model = warm_model
+        preference_model.start()
+        threading.Thread(target=run_preference_checkpoints, name='preference-checkpoints', daemon=True).start()
+        atexit.register(save_preference_checkpoint)
+
+        resources_load_seconds = time.time() - start
+        resources_ready = True
+        logging.info(f"Resources ready in {resources_load_seconds:.2f}s")
+
+@app.before_request
+def ensure_resources():
+    if request.endpoint != 'ready':
+        init_resources()
+        # Pin the live catalogue version until the request is torn down; a
+        # reload swaps in a new one for later requests without waiting for this
+        g.catalogue_version = catalogue_manager.acquire()
+
+@app.teardown_request
+def release_catalogue(exc):
+    if 'catalogue_version' in g:
+        catalogue_manager.release(g.pop('catalogue_version'))
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 503 until init_resources has finished"""
+    return jsonify({
+        "ready": resources_ready,
+        "loading": resources_lock.locked(),
+        "load_seconds": resources_load_seconds,
+    }), 200 if resources_ready else 503
+
+@app.route('/catalogue_status')
+def catalogue_status():
+    """Live and previous catalogue versions with build time and memory"""
+    status = catalogue_manager.status()
+    status["products"] = len(current_catalogue()['amazon_df'])
+    return jsonify(status)
+
+@app.route('/reload_catalogue', methods=['POST'])
+def reload_catalogue():
+    """Rebuild the catalogue in the background and swap it in when ready"""
+    started = catalogue_manager.reload()
+    return jsonify({
+        "status": "reloading" if started else "already_reloading",
+        "version_id": catalogue_manager.version_id,
+    }), 202
+
+def create_app(warm_up=None):
+    """Return the app; with warm_up (default: WARM_UP=1 in the environment)
+    resources start loading in a background thread instead of on the first request"""
+    if warm_up is None:
+        warm_up = os.environ.get('WARM_UP') == '1'
+    if warm_up:
+        threading.Thread(target=init_resources, name='warm-up', daemon=True).start()
+    return app
+
+if __name__ == '__main__':
+    # With debug=True the reloader serves from a child process; only that one warms up
+    create_app(warm_up=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
+    app.run(host="0.0.0.0", port=5000, debug=True)
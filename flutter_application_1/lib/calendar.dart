@@ -246,7 +246,7 @@ class _CalendarTabState extends State<CalendarTab> {
         body: jsonEncode(requestBody),
       );
 
-      if (response.statusCode == 200) {
+      if (response.statusCode == 200 || response.statusCode == 202) {
         print('Notification sent successfully');
         print('Response: ${response.body}');
       } else {
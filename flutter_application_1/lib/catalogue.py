@@ -0,0 +1,466 @@
+import os
+import re
+import ast
+import hashlib
+import json
+import time
+import logging
+import numpy as np
+import pandas as pd
+from shared_catalogue import unpack_groups
+
+CACHE_FORMAT_VERSION = 2
+NUMERIC_COLUMNS = ['initial_price', 'final_price', 'rating', 'reviews_count']
+LIST_COLUMNS = ['features', 'categories']
+
+MEN_KEYWORDS = ['men', 'male', 'boy', "men's", "boy's"]
+WOMEN_KEYWORDS = ['women', 'female', 'girl', "women's", "girl's"]
+GENDER_TAGS = ['men', 'women', 'unisex']
+
+
+def _keyword_pattern(keywords):
+    # Whole words only (plurals allowed), so "women" never counts as "men"
+    return re.compile(r"\b(?:%s)(?:'s|s)?\b" % "|".join(map(re.escape, keywords)), re.IGNORECASE)
+
+
+MEN_PATTERN = _keyword_pattern(MEN_KEYWORDS)
+WOMEN_PATTERN = _keyword_pattern(WOMEN_KEYWORDS)
+
+
+def parse_numeric(series):
+    """Strip currency symbols, quotes and text from a column; missing or invalid -> 0.0"""
+    cleaned = series.astype(str).str.replace(r'[^0-9.]', '', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce').fillna(0.0)
+
+
+def parse_list(value):
+    """Turn a stringified JSON/Python list into a list of strings"""
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [str(v) for v in value]
+    if not isinstance(value, str) or not value.strip() or value.strip().lower() == 'null':
+        return []
+    text = value.strip()
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            parsed = parse(text)
+        except (ValueError, SyntaxError, TypeError):
+            continue
+        if isinstance(parsed, (list, tuple)):
+            return [str(v) for v in parsed if v is not None]
+        return [str(parsed)]
+    return [text]
+
+
+def gender_tags(texts):
+    """'men', 'women' or 'unisex' (neither or both mentioned) for each text, as a categorical"""
+    texts = pd.Series(texts, dtype=object).fillna('')
+    men = texts.str.contains(MEN_PATTERN).to_numpy(dtype=bool)
+    women = texts.str.contains(WOMEN_PATTERN).to_numpy(dtype=bool)
+    tags = np.select([men & ~women, women & ~men], GENDER_TAGS[:2], GENDER_TAGS[2])
+    return pd.Categorical(tags, categories=GENDER_TAGS)
+
+
+def normalise_catalogue(raw_df):
+    """Typed, cleaned copy of the raw Amazon dataset.
+
+    Prices, rating and reviews_count become float32 (missing -> 0.0),
+    features and categories become lists of strings, and `features_text`
+    and `text` hold the strings used for TF-IDF and embeddings, and
+    `gender_tag` is the categorical men/women/unisex tag from title and
+    description.
+    """
+    start = time.time()
+    df = raw_df.drop(columns=['embedding'], errors='ignore').copy()
+
+    for column in NUMERIC_COLUMNS:
+        if column in df.columns:
+            df[column] = parse_numeric(df[column]).astype(np.float32)
+        else:
+            df[column] = np.zeros(len(df), dtype=np.float32)
+
+    for column in LIST_COLUMNS:
+        values = df[column] if column in df.columns else [None] * len(df)
+        df[column] = [parse_list(v) for v in values]
+
+    for column in ['asin', 'title', 'description', 'department', 'bs_category', 'images', 'url']:
+        if column not in df.columns:
+            df[column] = ''
+    df['title'] = df['title'].fillna('Unknown Product').astype(str)
+    df['department'] = df['department'].fillna('Unknown Department').astype(str)
+    for column in ['asin', 'description', 'bs_category', 'images', 'url']:
+        df[column] = df[column].fillna('').astype(str)
+
+    df['features_text'] = [" ".join(features) for features in df['features']]
+    df['text'] = df['title'] + " " + df['features_text'] + " " + df['department']
+    df['gender_tag'] = gender_tags(df['title'] + " " + df['description'])
+
+    logging.info(f"Normalised {len(df)} catalogue rows in {time.time() - start:.2f}s")
+    return df.reset_index(drop=True)
+
+
+def catalogue_fingerprint(df):
+    """Content hash of the columns derived indexes depend on"""
+    frame = pd.DataFrame({
+        'asin': df['asin'],
+        'department': df['department'],
+        'features_text': df['features_text'],
+        'categories': ["|".join(c) for c in df['categories']],
+    })
+    hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return f"{CACHE_FORMAT_VERSION}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def save_catalogue_cache(df, path, source_signature=''):
+    """Write the normalised catalogue column by column to an .npz file"""
+    arrays = {}
+    kinds = {}
+    for column in df.columns:
+        if column in LIST_COLUMNS:
+            # Ragged lists are stored flattened with row offsets
+            lengths = np.fromiter((len(v) for v in df[column]), dtype=np.int64, count=len(df))
+            arrays[f"{column}__offsets"] = np.concatenate([[0], np.cumsum(lengths)])
+            arrays[f"{column}__values"] = np.array([item for v in df[column] for item in v], dtype=str)
+            kinds[column] = 'list'
+        elif isinstance(df[column].dtype, pd.CategoricalDtype):
+            arrays[f"{column}__codes"] = df[column].cat.codes.to_numpy()
+            arrays[f"{column}__categories"] = np.array(df[column].cat.categories, dtype=str)
+            kinds[column] = 'category'
+        elif pd.api.types.is_numeric_dtype(df[column]) or pd.api.types.is_bool_dtype(df[column]):
+            arrays[column] = df[column].to_numpy()
+            kinds[column] = 'numeric'
+        else:
+            arrays[column] = df[column].fillna('').astype(str).to_numpy(dtype=str)
+            kinds[column] = 'str'
+
+    meta = {'source': source_signature, 'columns': list(df.columns), 'kinds': kinds}
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, __meta__=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_catalogue_cache(path):
+    """Read a catalogue written by save_catalogue_cache; returns (df, source_signature)"""
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['__meta__']))
+        columns = {}
+        for column in meta['columns']:
+            kind = meta['kinds'][column]
+            if kind == 'list':
+                offsets = data[f"{column}__offsets"]
+                values = data[f"{column}__values"].tolist()
+                columns[column] = [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+            elif kind == 'category':
+                columns[column] = pd.Categorical.from_codes(
+                    data[f"{column}__codes"], data[f"{column}__categories"].tolist()
+                )
+            elif kind == 'str':
+                columns[column] = data[column].astype(object)
+            else:
+                columns[column] = data[column]
+    return pd.DataFrame(columns, columns=meta['columns']), meta['source']
+
+
+def load_catalogue(source_path, cache_path):
+    """Normalised catalogue from the columnar cache, rebuilt when the source CSV changes"""
+    signature = _source_signature(source_path)
+    if os.path.exists(cache_path):
+        try:
+            start = time.time()
+            df, cached_signature = load_catalogue_cache(cache_path)
+            if cached_signature == signature:
+                logging.info(f"Loaded normalised catalogue from {cache_path} in {time.time() - start:.2f}s")
+                return df
+            logging.info("Catalogue source changed, rebuilding normalised cache")
+        except Exception as e:
+            logging.error(f"Failed to read catalogue cache, rebuilding: {e}")
+
+    raw_df = pd.read_csv(source_path, usecols=lambda c: c != 'embedding')
+    df = normalise_catalogue(raw_df)
+    try:
+        save_catalogue_cache(df, cache_path, signature)
+        logging.info(f"Saved normalised catalogue to {cache_path}")
+    except Exception as e:
+        logging.error(f"Failed to save catalogue cache: {e}")
+    return df
+
+
+def _hash_strings(values):
+    # pandas' hash key is fixed, so every process gets the same hashes
+    return pd.util.hash_array(np.asarray(list(values), dtype=object), categorize=False)
+
+
+def _small_codes(codes, n_categories):
+    dtype = np.int8 if n_categories < 2 ** 7 else np.int16 if n_categories < 2 ** 15 else np.int32
+    return np.asarray(codes, dtype=dtype)
+
+
+class StringColumn:
+    """Strings packed into one UTF-8 buffer plus row offsets (two shareable arrays)"""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def pack(cls, values):
+        encoded = [str(value).encode('utf-8') for value in values]
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].decode('utf-8')
+
+    def take(self, rows):
+        """Strings at the rows, as an object array"""
+        return np.array([self[row] for row in rows], dtype=object)
+
+    def to_arrays(self, prefix):
+        return {f"{prefix}__data": self.data, f"{prefix}__offsets": self.offsets}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        return cls(arrays[f"{prefix}__data"], arrays[f"{prefix}__offsets"])
+
+
+class ListColumn:
+    """Per-row lists of strings: every item in one StringColumn, plus row offsets"""
+
+    def __init__(self, items, offsets):
+        self.items = items
+        self.offsets = offsets
+
+    @classmethod
+    def pack(cls, values):
+        lengths = np.fromiter((len(v) for v in values), dtype=np.int64, count=len(values))
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        return cls(StringColumn.pack(item for v in values for item in v), offsets)
+
+    def __getitem__(self, row):
+        return [self.items[i] for i in range(self.offsets[row], self.offsets[row + 1])]
+
+    def to_arrays(self, prefix):
+        return {**self.items.to_arrays(f"{prefix}__items"), f"{prefix}__offsets": self.offsets}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        return cls(StringColumn.from_arrays(arrays, f"{prefix}__items"), arrays[f"{prefix}__offsets"])
+
+
+class CategoryColumn:
+    """Low-cardinality strings as per-row codes, with each category's rows.
+
+    Categories (and so `groups`) keep the order in which they first appear.
+    """
+
+    def __init__(self, codes, categories, bounds, rows):
+        self.codes = codes
+        self.categories = list(categories)
+        self.code_for = {category: code for code, category in enumerate(self.categories)}
+        self.bounds = bounds
+        self.rows = rows
+        self.groups = unpack_groups(self.categories, bounds, rows)
+
+    @classmethod
+    def pack(cls, values):
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1)).astype(np.int64)
+        return cls(_small_codes(codes, len(uniques)), [str(u) for u in uniques], bounds, order.astype(np.int64))
+
+    def __getitem__(self, row):
+        return self.categories[self.codes[row]]
+
+    def code(self, category):
+        """Code of a category, -1 if no row has it"""
+        return self.code_for.get(category, -1)
+
+    def rows_for(self, category):
+        return self.groups.get(category, self.rows[:0])
+
+    def categorical(self):
+        return pd.Categorical.from_codes(self.codes, self.categories)
+
+    def to_arrays(self, prefix):
+        return {f"{prefix}__codes": self.codes, f"{prefix}__bounds": self.bounds, f"{prefix}__rows": self.rows}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix, categories):
+        return cls(arrays[f"{prefix}__codes"], categories, arrays[f"{prefix}__bounds"], arrays[f"{prefix}__rows"])
+
+
+class StringIndex:
+    """Rows holding a string, found by binary search over sorted 64-bit hashes.
+
+    Matches are compared against the column itself, so a hash collision
+    never returns a wrong row.
+    """
+
+    def __init__(self, column, hashes=None, rows=None):
+        self.column = column
+        if hashes is None:
+            hashes = _hash_strings(column)
+            rows = np.argsort(hashes, kind='stable')
+            hashes = hashes[rows]
+        self.hashes = hashes
+        self.rows = rows
+
+    def _candidates(self, values):
+        keys = _hash_strings(v if isinstance(v, str) else None for v in values)
+        return np.searchsorted(self.hashes, keys, side='left'), np.searchsorted(self.hashes, keys, side='right')
+
+    def rows_for(self, value):
+        """Rows holding the value, in row order"""
+        if not isinstance(value, str):
+            return []
+        (lo,), (hi,) = self._candidates([value])
+        return [int(row) for row in self.rows[lo:hi] if self.column[row] == value]
+
+    def first_rows(self, values):
+        """First row holding each value, -1 where none does"""
+        values = list(values)
+        first = np.full(len(values), -1, dtype=np.int64)
+        if not values:
+            return first
+        lo, hi = self._candidates(values)
+        for i in np.flatnonzero(hi > lo):
+            # Rows sharing a hash are in row order
+            for row in self.rows[lo[i]:hi[i]]:
+                if self.column[row] == values[i]:
+                    first[i] = row
+                    break
+        return first
+
+    def to_arrays(self, prefix):
+        return {f"{prefix}__hashes": self.hashes, f"{prefix}__order": self.rows}
+
+    @classmethod
+    def from_arrays(cls, column, arrays, prefix):
+        return cls(column, arrays[f"{prefix}__hashes"], arrays[f"{prefix}__order"])
+
+
+STRING_FIELDS = ['asin', 'title', 'images', 'url', 'features_text']
+CATEGORY_FIELDS = ['department', 'bs_category', 'gender_tag']
+
+
+class Catalogue:
+    """Product fields and lookups by asin, title and department, held in flat arrays.
+
+    Strings are packed into UTF-8 buffers, department/bs_category/gender_tag
+    into codes and the asin and title lookups into sorted hashes, so
+    to_arrays() can publish all of it and from_arrays() maps it in another
+    process without building anything per row. frame() is the numeric and
+    categorical view the rankers filter; its index is the catalogue row.
+    """
+
+    def __init__(self, df):
+        arrays = {}
+        for field in STRING_FIELDS:
+            column = StringColumn.pack(df[field])
+            arrays.update(column.to_arrays(field))
+            if field in ('asin', 'title'):
+                arrays.update(StringIndex(column).to_arrays(f"{field}_index"))
+        meta = {'rows': len(df), 'categories': {}}
+        for field in CATEGORY_FIELDS:
+            column = CategoryColumn.pack(df[field])
+            arrays.update(column.to_arrays(field))
+            meta['categories'][field] = column.categories
+        arrays.update(ListColumn.pack(df['features']).to_arrays('features'))
+        for field in NUMERIC_COLUMNS:
+            arrays[f"column__{field}"] = df[field].to_numpy()
+
+        # asin_id is the first row holding the row's asin
+        codes, _ = pd.factorize(df['asin'].to_numpy(dtype=object))
+        _, first_rows = np.unique(codes, return_index=True)
+        arrays['asin_id'] = first_rows[codes].astype(np.int64)
+        arrays['unique_rows'] = np.sort(first_rows).astype(np.int64)
+        self._attach(arrays, meta)
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Catalogue over arrays from to_arrays (typically memory-mapped); nothing is copied"""
+        catalogue = cls.__new__(cls)
+        catalogue._attach(arrays, meta)
+        return catalogue
+
+    def _attach(self, arrays, meta):
+        self._arrays, self._meta = arrays, meta
+        for field in STRING_FIELDS:
+            setattr(self, field, StringColumn.from_arrays(arrays, field))
+        for field in CATEGORY_FIELDS:
+            setattr(self, field, CategoryColumn.from_arrays(arrays, field, meta['categories'][field]))
+        self.features = ListColumn.from_arrays(arrays, 'features')
+        self.columns = {field: arrays[f"column__{field}"] for field in NUMERIC_COLUMNS}
+        self.asin_id = arrays['asin_id']
+        self.unique_rows = arrays['unique_rows']
+        self.asin_index = StringIndex.from_arrays(self.asin, arrays, 'asin_index')
+        self.title_index = StringIndex.from_arrays(self.title, arrays, 'title_index')
+
+    def to_arrays(self):
+        """(arrays, meta) describing the catalogue, for from_arrays in another process"""
+        return dict(self._arrays), self._meta
+
+    def __len__(self):
+        return self._meta['rows']
+
+    def frame(self):
+        """Numeric columns, categorical department/bs_category/gender_tag and asin_id, sharing these arrays"""
+        columns = dict(self.columns)
+        for field in CATEGORY_FIELDS:
+            columns[field] = getattr(self, field).categorical()
+        columns['asin_id'] = self.asin_id
+        return pd.DataFrame(columns, copy=False)
+
+    def row_for_asin(self, asin):
+        rows = self.asin_index.rows_for(asin)
+        return rows[0] if rows else None
+
+    def asin_rows(self, asins):
+        """First row of each asin (its asin_id), -1 where unknown"""
+        return self.asin_index.first_rows(asins)
+
+    def rows_for_title(self, title):
+        return self.title_index.rows_for(title)
+
+    def rows_for_department(self, department):
+        return self.department.rows_for(department)
+
+    def product(self, asin):
+        """Fields of an asin's catalogue row as a dict; KeyError if unknown"""
+        row = self.row_for_asin(asin)
+        if row is None:
+            raise KeyError(f"Unknown product {asin}")
+        product = {field: getattr(self, field)[row] for field in STRING_FIELDS + CATEGORY_FIELDS}
+        product.update({field: values[row].item() for field, values in self.columns.items()})
+        product['features'] = self.features[row]
+        return product
+
+    def text_at(self, row):
+        """Title + features + department text used for models and embeddings"""
+        return f"{self.title[row]} {self.features_text[row]} {self.department[row]}"
+
+    def text(self, asin):
+        row = self.row_for_asin(asin)
+        return self.text_at(row) if row is not None else None
+
+    def texts(self):
+        """text_at for every row, in row order"""
+        departments = self.department.categories
+        return [
+            f"{title} {features} {departments[code]}"
+            for title, features, code in zip(self.title, self.features_text, self.department.codes.tolist())
+        ]
@@ -0,0 +1,191 @@
+import sys
+import mmap
+import time
+import uuid
+import logging
+import threading
+import weakref
+from collections import deque
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Containers longer than this are sized from a sample
+SIZE_SAMPLE = 1000
+
+
+def estimate_bytes(value, seen=None, depth=0):
+    """Approximate heap memory held by a value, counting shared objects once.
+
+    Frames use pandas' deep memory usage, arrays their own buffers (views
+    count their base), sparse matrices their three arrays. Memory-mapped
+    data lives in the page cache and counts as zero.
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen or depth > 6:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, (np.memmap, mmap.mmap)):
+        return 0
+    if isinstance(value, np.ndarray):
+        if value.base is not None:
+            return estimate_bytes(value.base, seen, depth + 1)
+        return value.nbytes
+    if hasattr(value, 'indptr') and hasattr(value, 'indices'):
+        return sum(estimate_bytes(getattr(value, name), seen, depth + 1) for name in ('data', 'indices', 'indptr'))
+    if isinstance(value, dict):
+        items = list(value.items())
+        sample = items[:SIZE_SAMPLE]
+        size = sum(estimate_bytes(k, seen, depth + 1) + estimate_bytes(v, seen, depth + 1) for k, v in sample)
+        return sys.getsizeof(value) + (size * len(items) // len(sample) if sample else 0)
+    if isinstance(value, (list, tuple, set, frozenset, deque)):
+        items = list(value)
+        sample = items[:SIZE_SAMPLE]
+        size = sum(estimate_bytes(v, seen, depth + 1) for v in sample)
+        return sys.getsizeof(value) + (size * len(items) // len(sample) if sample else 0)
+    if hasattr(value, '__dict__') and not isinstance(value, type):
+        return sys.getsizeof(value) + estimate_bytes(vars(value), seen, depth + 1)
+    return sys.getsizeof(value)
+
+
+class CatalogueVersion:
+    """One complete build of the catalogue state.
+
+    Its entries are never replaced once it is live; only inputs that are
+    built on first use (like the text features) may be added. Requests
+    and background jobs hold a reference to the version they started on,
+    and a retired version is freed once the last of them lets go.
+    """
+
+    def __init__(self, state, load_seconds):
+        self.state = state
+        self.version_id = uuid.uuid4().hex[:12]
+        self.built_at = datetime.now()
+        self.load_seconds = load_seconds
+        self.readers = 0
+        seen = set()
+        self.memory_by_component = {name: estimate_bytes(value, seen) for name, value in state.items()}
+        self.memory_bytes = sum(self.memory_by_component.values())
+
+    def summary(self):
+        return {
+            "version_id": self.version_id,
+            "built_at": self.built_at.isoformat(),
+            "load_seconds": round(self.load_seconds, 3),
+            "memory_bytes": self.memory_bytes,
+            "memory_by_component": self.memory_by_component,
+        }
+
+
+class CatalogueManager:
+    """Builds catalogue versions in the background and swaps them in whole.
+
+    `build()` returns the state of a new version (a dict of name -> value)
+    without touching the live one. Publishing it is a single assignment
+    of `current`, so a swap never waits for or holds back a request:
+    requests pin the version they start on with acquire() and finish on
+    it, new ones get the new version straight away, and the old one is
+    freed when its last reader releases it. `after_swap(state)`, if
+    given, runs in the reloading thread once the new version is live.
+    """
+
+    def __init__(self, build, after_swap=None, history=5):
+        self.build = build
+        self.after_swap = after_swap
+        self.current = None
+        self.history = deque(maxlen=history)
+        self.last_error = None
+        self._reload_lock = threading.Lock()
+        self._readers_lock = threading.Lock()
+        # Retired versions drop out of here once nothing references them
+        self._retired = weakref.WeakSet()
+
+    def acquire(self):
+        """Pin the live version for a request; returns it (None before the first load)"""
+        version = self.current
+        if version is not None:
+            with self._readers_lock:
+                version.readers += 1
+        return version
+
+    def release(self, version):
+        """Unpin a version returned by acquire()"""
+        if version is not None:
+            with self._readers_lock:
+                version.readers -= 1
+
+    @property
+    def reloading(self):
+        return self._reload_lock.locked()
+
+    def load(self):
+        """Build a version in this thread and swap it in; returns it"""
+        with self._reload_lock:
+            return self._load()
+
+    def reload(self):
+        """Start a background rebuild unless one is running; returns whether it started"""
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self._load()
+            except Exception as e:
+                logging.error(f"Catalogue reload failed, keeping version {self.version_id}: {e}")
+            finally:
+                self._reload_lock.release()
+
+        threading.Thread(target=run, name='catalogue-reload', daemon=True).start()
+        return True
+
+    @property
+    def version_id(self):
+        version = self.current
+        return version.version_id if version is not None else None
+
+    def _load(self):
+        start = time.time()
+        try:
+            version = CatalogueVersion(self.build(), 0.0)
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        version.load_seconds = time.time() - start
+        self.last_error = None
+        self._swap(version)
+        return version
+
+    def _swap(self, version):
+        previous = self.current
+        self.current = version
+        if previous is not None:
+            self._retired.add(previous)
+            self.history.appendleft(previous.summary())
+        logging.info(
+            f"Catalogue version {version.version_id} live: built in {version.load_seconds:.2f}s, "
+            f"~{version.memory_bytes / 2 ** 20:.1f} MiB"
+        )
+        if self.after_swap is not None:
+            self.after_swap(version.state)
+
+    def status(self):
+        current = self.current
+        retired = list(self._retired)
+        with self._readers_lock:
+            in_flight = sum(version.readers for version in retired) + (current.readers if current is not None else 0)
+            # Versions still referenced by requests or jobs that started on them
+            draining = [
+                {"version_id": version.version_id, "readers": version.readers} for version in retired
+            ]
+        return {
+            "current": current.summary() if current is not None else None,
+            "previous": list(self.history),
+            "reloading": self.reloading,
+            "in_flight_requests": in_flight,
+            "draining": draining,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,134 @@
+import os
+import json
+import logging
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer
+from shared_catalogue import pack_groups, unpack_groups
+
+
+class ContentIndex:
+    """Catalogue-wide term counts plus a category -> rows inverted index.
+
+    Term counts are tokenised once for the whole catalogue. At query time
+    the IDF weights are computed from the rows being scored, which gives
+    the same scores as fitting TfidfVectorizer(stop_words='english') on
+    those rows and taking the cosine with the transformed query. The
+    vocabulary is kept as a sorted term array (the column order
+    CountVectorizer uses), so the whole index is a few arrays that
+    to_arrays()/from_arrays() can share between processes.
+    """
+
+    def __init__(self):
+        self.analyzer = CountVectorizer(stop_words='english').build_analyzer()
+        self.counts = None
+        self.terms = np.array([], dtype=str)
+        self.category_rows = {}
+        self.fingerprint = None
+
+    def build(self, features_texts, categories, fingerprint=None):
+        """Tokenise every product once and index rows by category"""
+        texts = list(features_texts)
+        vectorizer = CountVectorizer(stop_words='english')
+        try:
+            self.counts = vectorizer.fit_transform(texts).tocsr()
+            self.terms = vectorizer.get_feature_names_out().astype(str)
+        except ValueError:
+            # Every text was empty or stop words
+            self.counts = csr_matrix((len(texts), 0), dtype=np.int64)
+            self.terms = np.array([], dtype=str)
+
+        rows_by_category = {}
+        for row, product_categories in enumerate(categories):
+            for category in set(product_categories):
+                rows_by_category.setdefault(category, []).append(row)
+        self.category_rows = {c: np.array(r, dtype=np.int64) for c, r in rows_by_category.items()}
+        self.fingerprint = fingerprint
+        logging.info(
+            f"Built content index: {self.counts.shape[0]} products, "
+            f"{self.counts.shape[1]} terms, {len(self.category_rows)} categories"
+        )
+        return self
+
+    def rows_in_categories(self, categories):
+        """Sorted rows having at least one of the categories"""
+        rows = [self.category_rows[c] for c in categories if c in self.category_rows]
+        if not rows:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(rows))
+
+    def query_counts(self, query):
+        """Term counts of the query over the index vocabulary; unknown terms are dropped"""
+        tokens = np.array(self.analyzer(query), dtype=str)
+        if not len(self.terms) or not len(tokens):
+            return np.zeros(len(self.terms))
+        positions = np.minimum(np.searchsorted(self.terms, tokens), len(self.terms) - 1)
+        known = positions[self.terms[positions] == tokens]
+        return np.bincount(known, minlength=len(self.terms)).astype(np.float64)
+
+    def score(self, query, rows):
+        """TF-IDF cosine similarity between the query and each of the rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return np.zeros(0)
+        counts = self.counts[rows]
+        n_terms = counts.shape[1]
+
+        # Document frequency within the scored rows, smoothed as TfidfVectorizer does
+        doc_freq = np.bincount(counts.indices, minlength=n_terms)
+        idf = np.log((1 + len(rows)) / (1 + doc_freq)) + 1
+
+        weighted = counts.multiply(idf).tocsr()
+        row_norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+
+        # Terms absent from these rows would not be in a per-request vocabulary
+        query_vector = self.query_counts(query) * idf * (doc_freq > 0)
+        query_norm = np.linalg.norm(query_vector)
+        if query_norm == 0:
+            return np.zeros(len(rows))
+
+        dots = weighted @ query_vector
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(row_norms > 0, dots / (row_norms * query_norm), 0.0)
+        return scores
+
+    def to_arrays(self):
+        """(arrays, meta) describing the index, for from_arrays in another process"""
+        categories, category_bounds, category_rows = pack_groups(self.category_rows)
+        arrays = {
+            'data': self.counts.data,
+            'indices': self.counts.indices,
+            'indptr': self.counts.indptr,
+            'terms': self.terms,
+            'category_bounds': category_bounds,
+            'category_rows': category_rows,
+        }
+        meta = {'shape': list(self.counts.shape), 'categories': categories, 'fingerprint': self.fingerprint}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Index over arrays from to_arrays (typically memory-mapped); nothing is copied"""
+        index = cls()
+        index.counts = csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(meta['shape']), copy=False
+        )
+        index.terms = arrays['terms']
+        index.category_rows = unpack_groups(meta['categories'], arrays['category_bounds'], arrays['category_rows'])
+        index.fingerprint = meta['fingerprint']
+        return index
+
+    def save(self, path):
+        """Persist the index arrays and their meta to one .npz file"""
+        arrays, meta = self.to_arrays()
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            arrays = {name: data[name] for name in data.files if name != 'meta'}
+        return cls.from_arrays(arrays, meta)
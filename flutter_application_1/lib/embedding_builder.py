@@ -0,0 +1,154 @@
+"""Incremental product embedding builder.
+
+Each product's vector is keyed by a hash of its embedding text (title +
+features + department), so refreshing the catalogue only encodes products
+that are new or whose text changed. Usage:
+
+    python embedding_builder.py [--rebuild] [--workers N] [--batch-size N]
+"""
+import os
+import sys
+import time
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from embedding_store import EmbeddingStore
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+BATCH_SIZE = 64
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE_PATH = os.path.join(BASE_DIR, 'embedding_store')
+DEFAULT_CATALOGUE_PATH = os.path.join(BASE_DIR, 'Amazon products global dataset.csv')
+DEFAULT_CATALOGUE_CACHE_PATH = os.path.join(BASE_DIR, 'catalogue_cache.npz')
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def encode_texts(model, texts, batch_size=BATCH_SIZE):
+    """Encode texts in fixed-size batches as a float32 matrix"""
+    if not texts:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    vectors = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+_worker_model = None
+
+
+def _init_worker(model_name):
+    global _worker_model
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name, device='cpu')
+
+
+def _encode_shard(args):
+    texts, batch_size = args
+    return encode_texts(_worker_model, texts, batch_size)
+
+
+def encode_in_pool(texts, workers, model_name=MODEL_NAME, batch_size=BATCH_SIZE):
+    """Shard texts across CPU worker processes, each loading the model once"""
+    shard_size = max(batch_size, -(-len(texts) // (workers * 4)))
+    shards = [(texts[i:i + shard_size], batch_size) for i in range(0, len(texts), shard_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_name,)) as pool:
+        return np.vstack(list(pool.map(_encode_shard, shards)))
+
+
+def build_embeddings(store, asins, texts, model=None, model_name=MODEL_NAME,
+                     batch_size=BATCH_SIZE, workers=0, rebuild=False):
+    """Write a store version covering every product, encoding only unseen texts.
+
+    Vectors already in the store are reused when their content hash matches
+    (and they came from the same model), unless rebuild is set. A store
+    written without hashes (migrated from the legacy CSV) is reused by asin
+    instead, and the new version records the hashes. With workers > 1 the
+    texts to encode are sharded across a process pool; otherwise `model`
+    is used in this process.
+
+    Returns (version, reused, encoded).
+    """
+    start = time.time()
+    asins = [str(a) for a in asins]
+    texts = [str(t) for t in texts]
+    if not asins:
+        raise ValueError("No products to embed")
+    hashes = [text_hash(t) for t in texts]
+
+    cached = {}
+    by_asin = {}
+    if not rebuild and store.exists():
+        if store.matrix is None or store.is_stale():
+            store.open()
+        if store.model_name in (None, model_name):
+            if len(store.hashes) == len(store.asins):
+                cached = {h: row for row, h in enumerate(store.hashes) if h}
+            else:
+                by_asin = store.asin_to_row
+    source_rows = np.array(
+        [cached.get(h, by_asin.get(a, -1)) for h, a in zip(hashes, asins)], dtype=np.int64
+    )
+
+    # Encode each distinct missing text once
+    missing = {}
+    for h, text, row in zip(hashes, texts, source_rows):
+        if row < 0 and h not in missing:
+            missing[h] = text
+    missing_texts = list(missing.values())
+    if missing_texts:
+        logging.info(f"Encoding {len(missing_texts)} new or changed products")
+        if workers and workers > 1:
+            new_vectors = encode_in_pool(missing_texts, workers, model_name, batch_size)
+        else:
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(model_name)
+            new_vectors = encode_texts(model, missing_texts, batch_size)
+        new_rows = {h: i for i, h in enumerate(missing)}
+    else:
+        new_vectors = None
+        new_rows = {}
+
+    dim = new_vectors.shape[1] if new_vectors is not None else store.matrix.shape[1]
+    matrix = np.empty((len(asins), dim), dtype=np.float32)
+    reused = np.flatnonzero(source_rows >= 0)
+    if len(reused):
+        matrix[reused] = store.matrix[source_rows[reused]]
+    new_pos = np.flatnonzero(source_rows < 0)
+    if len(new_pos):
+        matrix[new_pos] = new_vectors[[new_rows[hashes[i]] for i in new_pos]]
+
+    version = store.write(asins, matrix, model_name=model_name, hashes=hashes)
+    logging.info(
+        f"Embedding build: {len(reused)} reused, {len(missing_texts)} encoded "
+        f"in {time.time() - start:.2f}s"
+    )
+    return version, len(reused), len(missing_texts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the product embedding store")
+    parser.add_argument('--rebuild', action='store_true', help="re-encode every product, ignoring stored vectors")
+    parser.add_argument('--catalogue', default=DEFAULT_CATALOGUE_PATH, help="catalogue CSV")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="embedding store directory")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=0, help="encoder processes (CPU); 0 encodes in-process")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from catalogue import load_catalogue
+    df = load_catalogue(args.catalogue, DEFAULT_CATALOGUE_CACHE_PATH)
+    version, reused, encoded = build_embeddings(
+        EmbeddingStore(args.store), df['asin'], df['text'],
+        batch_size=args.batch_size, workers=args.workers, rebuild=args.rebuild
+    )
+    print(f"Embedding store {version}: {reused} reused, {encoded} encoded")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
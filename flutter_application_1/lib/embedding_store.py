@@ -0,0 +1,141 @@
+import os
+import json
+import uuid
+import logging
+import numpy as np
+
+
+class EmbeddingStore:
+    """Product embeddings kept as one contiguous float32 matrix on disk.
+
+    The matrix is opened with mmap so every worker process that opens the
+    same store shares one physical copy through the OS page cache. Rows are
+    written L2-normalised, so cosine scoring can read them in place.
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, path):
+        self.path = path
+        self.matrix = None
+        self.asins = []
+        self.asin_to_row = {}
+        self.hashes = []
+        self.model_name = None
+        self.normalised = False
+        self.version = None
+        self._index_mtime = None
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, self.INDEX_FILE)
+
+    def exists(self):
+        """Check whether a complete store has been written"""
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            return os.path.exists(os.path.join(self.path, index['matrix_file']))
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def write(self, asins, embeddings, model_name=None, hashes=None):
+        """Write embeddings as one float32 matrix plus an asin->row index.
+
+        `hashes` optionally records the content hash each vector was encoded
+        from, so later builds can reuse it.
+        """
+        matrix = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32))
+        asins = [str(a) for a in asins]
+        hashes = list(hashes) if hashes is not None else None
+        if matrix.ndim != 2 or len(matrix) != len(asins):
+            raise ValueError(f"Expected {len(asins)} embedding rows, got shape {matrix.shape}")
+
+        # Keep the first vector for duplicated asins
+        seen = {}
+        for i, asin in enumerate(asins):
+            seen.setdefault(asin, i)
+        if len(seen) != len(asins):
+            keep = np.fromiter(seen.values(), dtype=np.int64, count=len(seen))
+            matrix = matrix[keep]
+            asins = list(seen.keys())
+            if hashes is not None:
+                hashes = [hashes[i] for i in keep]
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+
+        os.makedirs(self.path, exist_ok=True)
+        version = uuid.uuid4().hex
+        matrix_file = f"embeddings-{version}.npy"
+
+        # Each version gets its own matrix file; swapping index.json commits it
+        np.save(os.path.join(self.path, matrix_file), matrix)
+        index = {
+            'version': version,
+            'matrix_file': matrix_file,
+            'dim': int(matrix.shape[1]),
+            'count': int(matrix.shape[0]),
+            'model_name': model_name,
+            'normalised': True,
+            'asins': asins,
+            'hashes': hashes,
+        }
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+        logging.info(f"Wrote {len(asins)} embeddings (dim={matrix.shape[1]}) to {self.path}")
+
+        self._remove_stale_matrices(matrix_file)
+        return version
+
+    def _remove_stale_matrices(self, current_file):
+        for name in os.listdir(self.path):
+            if name.startswith('embeddings-') and name.endswith('.npy') and name != current_file:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    # Still mapped by another process (Windows); cleaned up next time
+                    pass
+
+    def open(self):
+        """Memory-map the current matrix read-only"""
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.matrix = np.load(os.path.join(self.path, index['matrix_file']), mmap_mode='r')
+        self.asins = index['asins']
+        self.asin_to_row = {asin: i for i, asin in enumerate(self.asins)}
+        self.hashes = index.get('hashes') or []
+        self.model_name = index.get('model_name')
+        self.normalised = bool(index.get('normalised'))
+        self.version = index['version']
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+        logging.info(f"Opened embedding store {self.version} with {len(self.asins)} vectors")
+        return self
+
+    def is_stale(self):
+        """Check (with one stat call) whether a newer version has been written"""
+        try:
+            return os.stat(self.index_path).st_mtime_ns != self._index_mtime
+        except OSError:
+            return False
+
+    def current_version(self):
+        """Version id on disk, which may be newer than the one opened"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)['version']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def rows_for(self, asins):
+        """Matrix row for each asin, -1 where the asin has no vector"""
+        return np.fromiter(
+            (self.asin_to_row.get(str(a), -1) for a in asins),
+            dtype=np.int64,
+            count=len(asins)
+        )
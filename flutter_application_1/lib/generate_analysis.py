@@ -4,6 +4,7 @@ import networkx as nx
 import logging
 from collections import defaultdict
 import os
+from preference_store import load_preferences
 
 # Configure logging with more detailed output
 logging.basicConfig(
@@ -20,29 +21,23 @@ DASHBOARD_PATH = os.path.join(BASE_DIR, 'user_metrics.png')
 NETWORK_PATH = os.path.join(BASE_DIR, 'user_item_network.png')
 PRECISION_HIST_PATH = os.path.join(BASE_DIR, 'precision_histogram.png')
 
-# 2. Enhanced data loading with validation
+# 2. Preferences from the app's snapshot plus the log tail written since
 def load_user_preferences():
-    """Load and validate user preferences from interactions log"""
+    """Load per-user likes/dislikes without replaying the whole interactions log"""
     user_prefs = defaultdict(lambda: {'likes': [], 'dislikes': []})
     
     try:
         if os.path.exists(INTERACTIONS_LOG_PATH):
             logger.debug(f"Loading interactions from {INTERACTIONS_LOG_PATH}")
-            interactions = pd.read_csv(INTERACTIONS_LOG_PATH)
-            
-            # Validate required columns
+
+            # Validate required columns (the header only; the replay reads the rows)
+            columns = pd.read_csv(INTERACTIONS_LOG_PATH, nrows=0).columns
             required_columns = {'user_id', 'product_id', 'interaction_type', 'timestamp'}
-            if not required_columns.issubset(interactions.columns):
-                missing = required_columns - set(interactions.columns)
+            if not required_columns.issubset(columns):
+                missing = required_columns - set(columns)
                 raise ValueError(f"Missing columns in CSV: {missing}")
-            
-            # Process interactions
-            for _, row in interactions.iterrows():
-                if row['interaction_type'] == 'like':
-                    user_prefs[row['user_id']]['likes'].append(row['product_id'])
-                elif row['interaction_type'] == 'dislike':
-                    user_prefs[row['user_id']]['dislikes'].append(row['product_id'])
-            
+
+            load_preferences(INTERACTIONS_LOG_PATH, preferences=user_prefs)
             logger.debug(f"Loaded {len(user_prefs)} users with preferences")
         else:
             logger.warning(f"Interactions log not found at {INTERACTIONS_LOG_PATH}")
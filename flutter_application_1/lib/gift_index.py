@@ -0,0 +1,126 @@
+import re
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Distinct substring queries remembered per index (least recently used go first)
+QUERY_CACHE_SIZE = 256
+
+
+def _bits(positions):
+    """Python int bitset with one bit per dataset row"""
+    bits = 0
+    for pos in positions:
+        bits |= 1 << int(pos)
+    return bits
+
+
+class GiftProfileIndex:
+    """Bitset indexes over dataset.csv plus interest -> catalogue rows.
+
+    Each distinct Occasion, Gender, Age and Interest value owns a bitset of
+    the dataset rows holding it, so a filter combination is a few ANDs.
+    Substring queries (the old str.contains filters) are resolved against
+    the distinct values and the most recent QUERY_CACHE_SIZE are cached.
+    Pass `interest_rows` (e.g. mapped from another process) instead of
+    `catalogue_departments` to skip resolving them.
+    """
+
+    def __init__(self, df, interest_to_department, catalogue_departments=None, interest_rows=None):
+        self.n_rows = len(df)
+        self.all_bits = (1 << self.n_rows) - 1
+        self.occasion_bits = self._value_bitmaps(df['Occasion'])
+        self.gender_bits = self._value_bitmaps(df['Gender'])
+        self.interest_bits = self._value_bitmaps(df['Interest'])
+
+        ages = df['Age'].to_numpy()
+        valid = ~np.isnan(ages.astype(float))
+        self.age_values = np.unique(ages[valid].astype(float))
+        self.age_bits = [_bits(np.flatnonzero(valid & (ages == age))) for age in self.age_values]
+
+        # Interest -> departments -> catalogue row numbers, resolved up front
+        if interest_rows is None:
+            catalogue_departments = np.asarray(catalogue_departments, dtype=object)
+            interest_rows = {
+                interest: np.flatnonzero(np.isin(catalogue_departments, departments))
+                for interest, departments in interest_to_department.items()
+            }
+        self.interest_rows = interest_rows
+
+        self._query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+        logging.info(
+            f"Built gift profile index over {self.n_rows} rows "
+            f"({len(self.occasion_bits)} occasions, {len(self.interest_bits)} interests)"
+        )
+
+    @staticmethod
+    def _value_bitmaps(column):
+        bitmaps = {}
+        for pos, value in enumerate(column.tolist()):
+            if isinstance(value, str):
+                bitmaps[value] = bitmaps.get(value, 0) | (1 << pos)
+        return bitmaps
+
+    def _contains(self, field, bitmaps, query):
+        """Rows whose value contains `query`, case-insensitively (like str.contains)"""
+        key = (field, query)
+        with self._query_lock:
+            bits = self._query_cache.get(key)
+            if bits is not None:
+                self._query_cache.move_to_end(key)
+                return bits
+
+        # Matched literally; request input is never compiled as a pattern
+        pattern = re.compile(re.escape(str(query)), re.IGNORECASE)
+        bits = 0
+        for value, value_bits in bitmaps.items():
+            if pattern.search(value):
+                bits |= value_bits
+        with self._query_lock:
+            self._query_cache[key] = bits
+            while len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return bits
+
+    def occasion(self, occasion):
+        if isinstance(occasion, list):
+            bits = 0
+            for value in occasion:
+                bits |= self.occasion_bits.get(value, 0)
+            return bits
+        return self._contains('occasion', self.occasion_bits, occasion)
+
+    def gender(self, gender):
+        return self._contains('gender', self.gender_bits, gender)
+
+    def age_between(self, start_age, end_age):
+        lo = np.searchsorted(self.age_values, start_age, side='left')
+        hi = np.searchsorted(self.age_values, end_age, side='right')
+        bits = 0
+        for age_bits in self.age_bits[lo:hi]:
+            bits |= age_bits
+        return bits
+
+    def match(self, occasion=None, gender=None, age_span=None):
+        """Bitset of dataset rows passing every given filter"""
+        bits = self.all_bits
+        if occasion:
+            bits &= self.occasion(occasion)
+        if gender:
+            bits &= self.gender(gender)
+        if age_span is not None:
+            bits &= self.age_between(*age_span)
+        return bits
+
+    def interests(self, bits):
+        """Distinct interests present in a row bitset"""
+        return [interest for interest, interest_bits in self.interest_bits.items() if interest_bits & bits]
+
+    def catalogue_rows(self, interests):
+        """Sorted catalogue row numbers in the departments mapped from these interests"""
+        rows = [self.interest_rows[i] for i in interests if i in self.interest_rows]
+        if not rows:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(rows))
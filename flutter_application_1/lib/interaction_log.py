@@ -0,0 +1,186 @@
+import os
+import csv
+import io
+import logging
+import threading
+from collections import deque
+from itertools import accumulate
+
+try:
+    import fcntl
+except ImportError:  # Windows: batches are still single appends
+    fcntl = None
+
+LOG_FIELDS = ['user_id', 'product_id', 'interaction_type', 'timestamp']
+
+
+def read_interactions(path, offset=0):
+    """Read interaction rows appended after a byte offset.
+
+    Returns (rows, end_offset). Passing end_offset back in later only
+    returns rows written since. A file smaller than offset is treated as
+    rewritten and read again from the start.
+    """
+    if not os.path.exists(path):
+        return [], 0
+
+    with open(path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        if offset > size:
+            offset = 0
+        f.seek(offset)
+        data = f.read()
+
+    # Only consume complete lines; a partial last line is read next time
+    end = data.rfind(b'\n') + 1
+    text = data[:end].decode('utf-8')
+    reader = csv.reader(io.StringIO(text))
+
+    rows = []
+    for values in reader:
+        # Skip blank lines and the header row
+        if not values or values[0] == 'user_id':
+            continue
+        rows.append(dict(zip(LOG_FIELDS, values)))
+    return rows, offset + end
+
+
+class InteractionLogWriter:
+    """Appends interaction rows from a background thread in batches.
+
+    Rows are queued in memory and written when batch_size rows are waiting
+    or flush_interval seconds have passed, with one write and one fsync per
+    batch. Each batch is written under an exclusive file lock (where the
+    platform has fcntl) so several worker processes can share one log.
+    Rows are numbered in the order they are queued; offset_for() maps a
+    written row's number to the log offset just past it. A batch that
+    fails to write is cut back out of the file and its rows go back to
+    the head of the queue, so they are retried in order and keep their
+    numbers.
+    """
+
+    def __init__(self, path, batch_size=64, flush_interval=1.0, batches_kept=4096):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_queued = 0
+        self.rows_written = 0
+        self.batches_written = 0
+        # (number of the batch's first row, log offset past each of its rows)
+        self._batch_ends = deque(maxlen=batches_kept)
+        self._queue = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='interaction-log-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, row):
+        """Queue one interaction row (a dict with LOG_FIELDS keys); returns its number"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Interaction log writer is closed")
+            self._queue.append([row.get(field, '') for field in LOG_FIELDS])
+            self.rows_queued += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+            return self.rows_queued
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue)
+
+    def _take(self):
+        with self._cond:
+            rows, self._queue = self._queue, []
+            return rows, self.rows_written + 1
+
+    def _put_back(self, rows):
+        # Ahead of rows queued since, which are numbered after them
+        with self._cond:
+            self._queue[:0] = rows
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Failed to write interaction log batch: {e}")
+            if closed:
+                return
+
+    def flush(self):
+        """Write every queued row now; returns the number written"""
+        with self._write_lock:
+            rows, first = self._take()
+            if not rows:
+                return 0
+            lines = []
+            for row in rows:
+                buffer = io.StringIO()
+                csv.writer(buffer, lineterminator='\n').writerow(row)
+                lines.append(buffer.getvalue().encode('utf-8'))
+            try:
+                start = self._append(b''.join(lines))
+            except Exception:
+                self._put_back(rows)
+                raise
+
+            ends = list(accumulate((len(line) for line in lines), initial=start))[1:]
+            self._batch_ends.append((first, ends))
+            self.rows_written += len(rows)
+            self.batches_written += 1
+            return len(rows)
+
+    def _append(self, data):
+        """Append one batch and fsync it; returns the offset of its first row"""
+        # Unbuffered, so nothing is left to be written after a truncate
+        with open(self.path, 'ab', buffering=0) as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                size = start = f.seek(0, os.SEEK_END)
+                if start == 0:
+                    header = (",".join(LOG_FIELDS) + "\n").encode('utf-8')
+                    data = header + data
+                    start = len(header)
+                try:
+                    view = memoryview(data)
+                    while view:
+                        view = view[f.write(view):]
+                    os.fsync(f.fileno())
+                except OSError:
+                    # A retried batch must not follow a partial copy of itself
+                    try:
+                        os.ftruncate(f.fileno(), size)
+                    except OSError as e:
+                        logging.error(f"Failed to remove partial interaction log batch: {e}")
+                    raise
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return start
+
+    def offset_for(self, row_number):
+        """Log offset just past a written row, None if it is unwritten or too old to know"""
+        with self._write_lock:
+            for first, ends in reversed(self._batch_ends):
+                if first <= row_number < first + len(ends):
+                    return ends[row_number - first]
+                if row_number >= first + len(ends):
+                    return None
+            return None
+
+    def close(self):
+        """Stop the background thread after writing everything queued"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
@@ -0,0 +1,193 @@
+import os
+import math
+import heapq
+import logging
+import threading
+from collections import defaultdict
+import numpy as np
+from scipy.sparse import csr_matrix
+
+INTERACTION_SCORES = {'like': 1.0, 'dislike': -1.0}
+
+
+class ItemNeighbourTable:
+    """Item-item cosine neighbours kept up to date one interaction at a time.
+
+    The user x item ratings and the item x item dot products are stored
+    sparsely, so a new event only touches the items that user rated. Each
+    item keeps its top_n most similar items; scoring a user is one sparse
+    matrix-vector product over that neighbour matrix.
+    """
+
+    def __init__(self, top_n=50):
+        self.top_n = top_n
+        self.user_items = defaultdict(dict)
+        self.dots = defaultdict(dict)
+        self.norms_sq = defaultdict(float)
+        self.item_counts = defaultdict(int)
+        self.items = []
+        self.item_idx = {}
+        self.log_offset = 0
+        self.neighbours = {}
+        self._dirty = set()
+        self._matrix = None
+        self._lock = threading.RLock()
+
+    def _index(self, item):
+        if item not in self.item_idx:
+            self.item_idx[item] = len(self.items)
+            self.items.append(item)
+        return self.item_idx[item]
+
+    def add(self, user_id, item, interaction_type):
+        """Apply one like/dislike event"""
+        score = INTERACTION_SCORES.get(interaction_type)
+        if score is None:
+            return
+        with self._lock:
+            self._index(item)
+            rated = self.user_items[user_id]
+            old = rated.get(item, 0.0)
+            delta = score - old
+            if delta == 0:
+                return
+
+            # Only items co-rated by this user change their dot product with `item`
+            for other, other_score in rated.items():
+                if other == item:
+                    continue
+                dot = self.dots[item].get(other, 0.0) + delta * other_score
+                self.dots[item][other] = dot
+                self.dots[other][item] = dot
+
+            self.norms_sq[item] += score * score - old * old
+            if old == 0:
+                self.item_counts[item] += 1
+            rated[item] = score
+
+            # A new norm changes every similarity involving `item`
+            self._dirty.add(item)
+            self._dirty.update(self.dots[item].keys())
+            self._matrix = None
+
+    def _refresh_neighbours(self, item):
+        norm = math.sqrt(self.norms_sq.get(item, 0.0))
+        if norm == 0:
+            self.neighbours[item] = []
+            return
+        sims = (
+            (dot / (norm * math.sqrt(self.norms_sq[other])), other)
+            for other, dot in self.dots[item].items()
+            if dot != 0 and self.norms_sq.get(other, 0.0) > 0
+        )
+        self.neighbours[item] = heapq.nlargest(self.top_n, sims)
+
+    def neighbour_matrix(self):
+        """Sparse item x item matrix holding each item's top-N similarities"""
+        with self._lock:
+            if self._matrix is None:
+                for item in self._dirty:
+                    self._refresh_neighbours(item)
+                self._dirty.clear()
+
+                rows, cols, data = [], [], []
+                for item, sims in self.neighbours.items():
+                    i = self.item_idx[item]
+                    for sim, other in sims:
+                        rows.append(i)
+                        cols.append(self.item_idx[other])
+                        data.append(sim)
+                n = len(self.items)
+                self._matrix = csr_matrix((data, (rows, cols)), shape=(n, n), dtype=np.float32)
+            return self._matrix
+
+    def recommend(self, user_id, top_n=10):
+        """Score unseen and seen items for a user from their rated items"""
+        with self._lock:
+            rated = self.user_items.get(user_id)
+            if not rated:
+                return []
+            matrix = self.neighbour_matrix()
+            user_vector = np.zeros(len(self.items), dtype=np.float32)
+            for item, score in rated.items():
+                user_vector[self.item_idx[item]] = score
+            items = self.items
+
+        scores = matrix.T @ user_vector
+        nonzero = np.flatnonzero(scores)
+        best = heapq.nlargest(top_n, nonzero, key=lambda i: scores[i])
+        return [(items[i], float(scores[i])) for i in best]
+
+    def user_ratings(self, user_id):
+        """Copy of a user's {item: rating} dict"""
+        with self._lock:
+            return dict(self.user_items.get(user_id, {}))
+
+    def interaction_matrix(self):
+        """User x item ratings as CSR with the user and item index maps"""
+        with self._lock:
+            user_idx = {u: i for i, u in enumerate(self.user_items)}
+            rows, cols, data = [], [], []
+            for user, rated in self.user_items.items():
+                for item, score in rated.items():
+                    rows.append(user_idx[user])
+                    cols.append(self.item_idx[item])
+                    data.append(score)
+            shape = (len(user_idx), len(self.items))
+            return csr_matrix((data, (rows, cols)), shape=shape, dtype=np.float32), user_idx, dict(self.item_idx)
+
+    def save(self, path):
+        """Persist ratings and co-occurrence dot products"""
+        # Copied out under the lock; the file is written without holding it
+        with self._lock:
+            users = list(self.user_items)
+            user_idx = {u: i for i, u in enumerate(users)}
+            r_rows, r_cols, r_data = [], [], []
+            for user, rated in self.user_items.items():
+                for item, score in rated.items():
+                    r_rows.append(user_idx[user])
+                    r_cols.append(self.item_idx[item])
+                    r_data.append(score)
+            d_rows, d_cols, d_data = [], [], []
+            for item, others in self.dots.items():
+                for other, dot in others.items():
+                    d_rows.append(self.item_idx[item])
+                    d_cols.append(self.item_idx[other])
+                    d_data.append(dot)
+            items = list(self.items)
+            log_offset = self.log_offset
+
+        # Per-process temp file, so workers saving at once never interleave
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            users=np.array(users, dtype=str),
+            items=np.array(items, dtype=str),
+            ratings=np.array([r_rows, r_cols], dtype=np.int64).reshape(2, -1),
+            rating_values=np.array(r_data, dtype=np.float32),
+            dots=np.array([d_rows, d_cols], dtype=np.int64).reshape(2, -1),
+            dot_values=np.array(d_data, dtype=np.float64),
+            log_offset=np.int64(log_offset),
+            top_n=np.int64(self.top_n),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Rebuild a table saved with save()"""
+        with np.load(path, allow_pickle=False) as data:
+            table = cls(top_n=int(data['top_n']))
+            users = data['users'].tolist()
+            for item in data['items'].tolist():
+                table._index(item)
+            items = table.items
+            for (u, i), score in zip(data['ratings'].T, data['rating_values']):
+                table.user_items[users[u]][items[i]] = float(score)
+                table.norms_sq[items[i]] += float(score) ** 2
+                table.item_counts[items[i]] += 1
+            for (i, j), dot in zip(data['dots'].T, data['dot_values']):
+                table.dots[items[i]][items[j]] = float(dot)
+            table.log_offset = int(data['log_offset'])
+        table._dirty.update(table.items)
+        logging.info(f"Loaded item neighbour table with {len(table.items)} items from {path}")
+        return table
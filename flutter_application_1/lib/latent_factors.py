@@ -0,0 +1,112 @@
+import time
+import logging
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+
+
+class LatentFactorModel:
+    """Truncated-SVD factors of the user x item like/dislike matrix.
+
+    The ratings matrix R is factorised as U S V^T; user factors are U S and
+    item factors are V, both float32, so a predicted rating is one dot
+    product. Catalogue items nobody has rated yet get factors projected
+    from their sentence embeddings with a ridge map fitted on the rated
+    items, which lets them be ranked alongside the rest.
+    """
+
+    def __init__(self, n_factors=32, ridge=1.0, seed=42):
+        self.n_factors = n_factors
+        self.ridge = ridge
+        self.seed = seed
+        self.user_ids = []
+        self.user_idx = {}
+        self.user_factors = None
+        self.item_ids = []
+        self.item_idx = {}
+        self.item_factors = None
+        self.n_rated_items = 0
+        self.fitted_at = None
+
+    def fit(self, ratings, user_ids, item_ids, catalogue_ids=None, catalogue_embeddings=None):
+        """Factorise ratings (CSR, users x items) and place unrated catalogue items by embedding"""
+        start = time.time()
+        item_ids = list(item_ids)
+        n_components = min(self.n_factors, ratings.shape[0] - 1, ratings.shape[1] - 1)
+        if n_components < 1:
+            raise ValueError("Not enough interactions to factorise")
+
+        svd = TruncatedSVD(n_components=n_components, random_state=self.seed)
+        user_factors = svd.fit_transform(ratings).astype(np.float32)
+        item_factors = svd.components_.T.astype(np.float32)
+
+        if catalogue_ids is not None and catalogue_embeddings is not None and len(catalogue_ids):
+            rated = set(item_ids)
+            catalogue_pos = {item: i for i, item in enumerate(catalogue_ids)}
+            warm = [(i, catalogue_pos[item]) for i, item in enumerate(item_ids) if item in catalogue_pos]
+            cold = [i for i, item in enumerate(catalogue_ids) if item not in rated]
+            if warm and cold:
+                factor_rows, embedding_rows = map(list, zip(*warm))
+                embeddings = np.asarray(catalogue_embeddings[embedding_rows], dtype=np.float32)
+                gram = embeddings.T @ embeddings + self.ridge * np.eye(embeddings.shape[1], dtype=np.float32)
+                projection = np.linalg.solve(gram, embeddings.T @ item_factors[factor_rows])
+                cold_embeddings = np.asarray(catalogue_embeddings[cold], dtype=np.float32)
+                item_factors = np.vstack([item_factors, (cold_embeddings @ projection).astype(np.float32)])
+                item_ids = item_ids + [catalogue_ids[i] for i in cold]
+
+        self.user_ids = list(user_ids)
+        self.user_idx = {user: i for i, user in enumerate(self.user_ids)}
+        self.user_factors = user_factors
+        self.n_rated_items = ratings.shape[1]
+        self.item_ids = item_ids
+        self.item_idx = {item: i for i, item in enumerate(item_ids)}
+        self.item_factors = item_factors
+        self.fitted_at = time.time()
+        logging.info(
+            f"Fitted {n_components} latent factors for {len(self.user_ids)} users, "
+            f"{self.n_rated_items} rated and {len(item_ids) - self.n_rated_items} embedded items "
+            f"in {time.time() - start:.2f}s"
+        )
+        return self
+
+    def user_vector(self, user_id, ratings=None):
+        """User factors, folded in from {item: rating} when given (new or changed users)"""
+        if ratings:
+            vector = np.zeros(self.item_factors.shape[1], dtype=np.float32)
+            for item, score in ratings.items():
+                i = self.item_idx.get(item)
+                if i is not None and i < self.n_rated_items:
+                    vector += score * self.item_factors[i]
+            return vector if vector.any() else None
+        i = self.user_idx.get(user_id)
+        return self.user_factors[i] if i is not None else None
+
+    def recommend(self, user_id, top_n=10, ratings=None):
+        """Top-N (item, predicted rating) pairs for a user"""
+        if self.item_factors is None:
+            return []
+        vector = self.user_vector(user_id, ratings)
+        if vector is None:
+            return []
+        scores = self.item_factors @ vector
+        if top_n < len(scores):
+            top = np.argpartition(-scores, top_n)[:top_n]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.item_ids[i], float(scores[i])) for i in top]
+
+    def similar_users(self, user_id, n=10, ratings=None):
+        """Users whose factor vectors have the highest cosine with this user's"""
+        if self.user_factors is None or not len(self.user_ids):
+            return []
+        vector = self.user_vector(user_id, ratings)
+        if vector is None:
+            return []
+        norms = np.linalg.norm(self.user_factors, axis=1) * np.linalg.norm(vector)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sims = np.where(norms > 0, (self.user_factors @ vector) / norms, 0.0)
+        own = self.user_idx.get(user_id)
+        if own is not None:
+            sims[own] = -np.inf
+        top = np.argsort(-sims, kind='stable')[:n]
+        return [(self.user_ids[i], float(sims[i])) for i in top if sims[i] > 0]
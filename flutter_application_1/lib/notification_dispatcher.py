@@ -0,0 +1,222 @@
+import json
+import queue
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+
+FCM_LEGACY_URL = 'https://fcm.googleapis.com/fcm/send'
+# Legacy API limit on registration_ids in one request
+MAX_TOKENS_PER_REQUEST = 1000
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class NotificationDispatcher:
+    """Sends FCM requests from an asyncio loop running on its own thread.
+
+    Request threads queue messages with send()/send_many() and get a
+    Future back straight away, so a slow FCM never holds a Flask worker.
+    The loop posts them over one pooled aiohttp session (keep-alive
+    connections, connect and total timeouts) with `concurrency` requests
+    in flight, retrying network errors, 429 and 5xx with exponential
+    backoff (or the server's Retry-After). At most `max_queue` messages
+    are queued or in flight; beyond that send() raises queue.Full.
+    """
+
+    def __init__(self, url=FCM_LEGACY_URL, server_key=None, max_queue=1000, concurrency=16,
+                 timeout=10.0, connect_timeout=3.0, max_retries=3, backoff=0.5, max_backoff=8.0):
+        self.url = url
+        self.server_key = server_key
+        self.max_queue = max_queue
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+        self.pending = 0
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+        self._stopping = None
+        self._thread = None
+        self._started = threading.Event()
+        self._start_error = None
+
+    def start(self):
+        """Start the loop thread and open the HTTP session; returns self"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+                self._thread.start()
+        self._started.wait()
+        if self._start_error is not None:
+            raise self._start_error
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+        except Exception as e:
+            self._start_error = e
+            logging.error(f"Notification dispatcher stopped: {e}")
+        finally:
+            self._started.set()
+            self._loop.close()
+
+    async def _serve(self):
+        import aiohttp
+        self._queue = asyncio.Queue()
+        self._stopping = asyncio.Event()
+        headers = {'Content-Type': 'application/json'}
+        if self.server_key:
+            headers['Authorization'] = f'key={self.server_key}'
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=30)
+        timeout = aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+            workers = [asyncio.create_task(self._work(session)) for _ in range(self.concurrency)]
+            self._started.set()
+            await self._stopping.wait()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        # Anything still queued will never be sent
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            self._finish(future, error=RuntimeError("Notification dispatcher stopped"))
+
+    def send(self, token, title, body):
+        """Queue a notification to one device; returns a Future for the FCM result"""
+        return self.submit({'to': token, 'notification': {'title': title, 'body': body}})
+
+    def send_many(self, tokens, title, body):
+        """Queue a notification to many devices, MAX_TOKENS_PER_REQUEST per request.
+
+        Returns one Future per request; a request the queue had no room
+        for gets a Future that has already failed with queue.Full.
+        """
+        tokens = list(dict.fromkeys(tokens))
+        futures = []
+        for i in range(0, len(tokens), MAX_TOKENS_PER_REQUEST):
+            payload = {
+                'registration_ids': tokens[i:i + MAX_TOKENS_PER_REQUEST],
+                'notification': {'title': title, 'body': body},
+            }
+            try:
+                futures.append(self.submit(payload))
+            except queue.Full as e:
+                future = Future()
+                future.set_exception(e)
+                futures.append(future)
+        return futures
+
+    def submit(self, payload):
+        """Queue one FCM request body; raises queue.Full when max_queue messages are pending"""
+        if self._loop is None or self._stopping is None or self._stopping.is_set():
+            raise RuntimeError("Notification dispatcher is not running")
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise queue.Full("Notification queue is full")
+        with self._lock:
+            self.pending += 1
+        future = Future()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (payload, future))
+        return future
+
+    async def _work(self, session):
+        while True:
+            payload, future = await self._queue.get()
+            try:
+                result = await self._post(session, payload)
+            except asyncio.CancelledError:
+                self._finish(future, error=RuntimeError("Notification dispatcher stopped"))
+                raise
+            except Exception as e:
+                logging.error(f"Failed to send notification: {e!r}")
+                self._finish(future, error=e)
+            else:
+                self._finish(future, result=result)
+            finally:
+                self._queue.task_done()
+
+    def _finish(self, future, result=None, error=None):
+        with self._lock:
+            self.pending -= 1
+            if error is None and result['status'] == 200:
+                self.sent += 1
+            else:
+                self.failed += 1
+        self._slots.release()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def _post(self, session, payload):
+        """POST with retries; returns {'status', 'body', 'attempts'} for the final response"""
+        import aiohttp
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                async with session.post(self.url, json=payload) as response:
+                    text = await response.text()
+                    if response.status not in RETRY_STATUSES or attempt >= self.max_retries:
+                        try:
+                            body = json.loads(text)
+                        except ValueError:
+                            body = text
+                        return {'status': response.status, 'body': body, 'attempts': attempt + 1}
+                    retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+            attempt += 1
+            with self._lock:
+                self.retried += 1
+            await asyncio.sleep(self._retry_delay(attempt, retry_after))
+
+    def _retry_delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(self.max_backoff, float(retry_after))
+            except ValueError:
+                pass
+        # Jittered so a burst of failures doesn't retry in lockstep
+        return min(self.max_backoff, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    def stop(self, timeout=5.0):
+        """Let queued messages go out for up to `timeout` seconds, then close the session"""
+        loop = self._loop
+        if loop is None or self._thread is None or not self._thread.is_alive():
+            return
+
+        async def drain():
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"Stopping notification dispatcher with {self.pending} messages unsent")
+            self._stopping.set()
+
+        asyncio.run_coroutine_threadsafe(drain(), loop)
+        self._thread.join(timeout + 5)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "max_queue": self.max_queue,
+                "sent": self.sent,
+                "failed": self.failed,
+                "retried": self.retried,
+                "rejected": self.rejected,
+            }
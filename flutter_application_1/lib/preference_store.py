@@ -0,0 +1,111 @@
+import os
+import logging
+import numpy as np
+from interaction_log import read_interactions
+
+SNAPSHOT_FORMAT_VERSION = 1
+PREFERENCE_LISTS = {'like': ('likes', 'dislikes'), 'dislike': ('dislikes', 'likes')}
+
+
+def snapshot_path_for(log_path):
+    """Snapshot file kept next to the interaction log it summarises"""
+    return os.path.splitext(log_path)[0] + '_snapshot.npz'
+
+
+def record_preference(preferences, user_id, product_id, interaction_type):
+    """Apply one like/dislike to a {user_id: {'likes': [], 'dislikes': []}} dict.
+
+    Repeated events are ignored and a like <-> dislike flip moves the
+    product to the other list, so each product appears at most once per
+    user. Returns True if anything changed.
+    """
+    lists = PREFERENCE_LISTS.get(interaction_type)
+    if lists is None:
+        return False
+    keep, drop = lists
+    prefs = preferences.get(user_id)
+    if prefs is None:
+        prefs = preferences[user_id] = {'likes': [], 'dislikes': []}
+
+    changed = False
+    if product_id in prefs[drop]:
+        prefs[drop].remove(product_id)
+        changed = True
+    if product_id not in prefs[keep]:
+        prefs[keep].append(product_id)
+        changed = True
+    return changed
+
+
+def save_preference_snapshot(preferences, path, log_offset):
+    """Write per-user like/dislike lists and the log offset they cover"""
+    users = list(preferences)
+    items = {}
+    user_index, item_index, kinds = [], [], []
+    for u, user_id in enumerate(users):
+        prefs = preferences[user_id]
+        for kind, key in ((1, 'likes'), (-1, 'dislikes')):
+            for product_id in prefs.get(key, []):
+                user_index.append(u)
+                item_index.append(items.setdefault(product_id, len(items)))
+                kinds.append(kind)
+
+    # Per-process temp file, so workers saving at once never interleave
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(
+        tmp_path,
+        format_version=np.int64(SNAPSHOT_FORMAT_VERSION),
+        log_offset=np.int64(log_offset),
+        users=np.array(users, dtype=str),
+        items=np.array(list(items), dtype=str),
+        user_index=np.array(user_index, dtype=np.int64),
+        item_index=np.array(item_index, dtype=np.int64),
+        kinds=np.array(kinds, dtype=np.int8),
+    )
+    os.replace(tmp_path, path)
+
+
+def load_preference_snapshot(path, preferences=None):
+    """Read a snapshot into `preferences` (a new dict by default); returns (preferences, log_offset)"""
+    preferences = {} if preferences is None else preferences
+    with np.load(path, allow_pickle=False) as data:
+        version = int(data['format_version'])
+        if version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported preference snapshot version {version}")
+        users = data['users'].tolist()
+        items = data['items'].tolist()
+        for user_id in users:
+            preferences[user_id] = {'likes': [], 'dislikes': []}
+        for u, i, kind in zip(data['user_index'].tolist(), data['item_index'].tolist(), data['kinds'].tolist()):
+            preferences[users[u]]['likes' if kind > 0 else 'dislikes'].append(items[i])
+        log_offset = int(data['log_offset'])
+    return preferences, log_offset
+
+
+def replay_preferences(preferences, log_path, offset=0):
+    """Apply interactions logged after `offset`; returns (end_offset, events replayed)"""
+    rows, end_offset = read_interactions(log_path, offset)
+    for row in rows:
+        record_preference(preferences, row['user_id'], row['product_id'], row['interaction_type'])
+    return end_offset, len(rows)
+
+
+def load_preferences(log_path, snapshot_path=None, preferences=None):
+    """Snapshot plus log tail; falls back to a full replay if the snapshot is unusable.
+
+    Returns (preferences, log_offset).
+    """
+    preferences = {} if preferences is None else preferences
+    snapshot_path = snapshot_path or snapshot_path_for(log_path)
+    offset = 0
+    if os.path.exists(snapshot_path):
+        try:
+            _, offset = load_preference_snapshot(snapshot_path, preferences)
+        except Exception as e:
+            logging.error(f"Failed to read preference snapshot, replaying full log: {e}")
+            preferences.clear()
+            offset = 0
+
+    offset, replayed = replay_preferences(preferences, log_path, offset)
+    logging.info(f"Loaded preferences for {len(preferences)} users ({replayed} events replayed)")
+    return preferences, offset
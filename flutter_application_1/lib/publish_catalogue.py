@@ -0,0 +1,52 @@
+"""Publish the catalogue arrays that serving workers map read-only.
+
+Run once before starting the workers, and again (or keep it running with
+--watch) when the datasets change. Workers started with the same
+SHARED_CATALOGUE_DIR map the published catalogue (strings, lookups and
+numeric columns), vector, trending and content indexes, interest rows,
+candidate pool and text features instead of reading the catalogue and
+building private copies, and reload when a new version is published.
+Usage:
+
+    SHARED_CATALOGUE_DIR=/srv/catalogue python publish_catalogue.py --watch
+    SHARED_CATALOGUE_DIR=/srv/catalogue gunicorn -w 8 'app:create_app(warm_up=True)'
+"""
+import sys
+import time
+import logging
+import argparse
+import app
+
+
+def publish():
+    start = time.time()
+    version = app.publish_shared_catalogue()
+    print(f"Published shared catalogue {version} in {time.time() - start:.2f}s")
+    return version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish shared catalogue arrays for serving workers")
+    parser.add_argument('--watch', action='store_true', help="republish whenever the datasets change")
+    parser.add_argument('--interval', type=float, default=app.CATALOGUE_POLL_INTERVAL, help="seconds between checks")
+    args = parser.parse_args(argv)
+    if app.SHARED_CATALOGUE_DIR is None:
+        parser.error("SHARED_CATALOGUE_DIR is not set")
+
+    # Stamped before building so a change made during the build is not missed
+    stamp = app.dataset_source_stamp()
+    publish()
+    while args.watch:
+        time.sleep(args.interval)
+        current = app.dataset_source_stamp()
+        if current != stamp:
+            stamp = current
+            try:
+                publish()
+            except Exception as e:
+                logging.error(f"Failed to publish shared catalogue: {e}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
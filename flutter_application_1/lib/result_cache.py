@@ -0,0 +1,101 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+def normalise_params(params):
+    """Hashable cache key part: strings stripped, lists sorted, empty values dropped"""
+    items = []
+    for name in sorted(params):
+        value = params[name]
+        if isinstance(value, str):
+            value = value.strip()
+        elif isinstance(value, (list, tuple, set)):
+            value = tuple(sorted(str(v).strip() for v in value))
+        if value in (None, '', ()):
+            continue
+        items.append((name, value))
+    return tuple(items)
+
+
+class ResultCache:
+    """LRU + TTL cache of endpoint results, invalidated per user.
+
+    Keys carry the user they belong to so that new feedback from a user
+    can drop just that user's entries. Sizes are estimated from the JSON
+    encoding of each value when it is stored.
+    """
+
+    def __init__(self, max_entries=2048, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached value for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, user_id=None):
+        size = len(json.dumps(value, default=str))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, size, user_id)
+            self._bytes += size
+            if user_id is not None:
+                self._user_keys.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size, user_id = self._entries.pop(key)
+        self._bytes -= size
+        if user_id is not None:
+            keys = self._user_keys.get(user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._user_keys[user_id]
+
+    def invalidate_user(self, user_id):
+        """Drop every entry stored for this user"""
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "approx_bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+            }
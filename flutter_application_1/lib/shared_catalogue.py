@@ -0,0 +1,103 @@
+import os
+import json
+import uuid
+import shutil
+import logging
+import numpy as np
+
+
+def pack_groups(groups):
+    """{key: row array} as (keys, bounds, rows) so it can be published as two arrays"""
+    keys = list(groups)
+    lengths = [len(groups[key]) for key in keys]
+    bounds = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    rows = np.concatenate([np.asarray(groups[key], dtype=np.int64) for key in keys]) if keys else np.array([], dtype=np.int64)
+    return keys, bounds, rows
+
+
+def unpack_groups(keys, bounds, rows):
+    """Inverse of pack_groups; every group is a view into `rows`"""
+    return {key: rows[bounds[i]:bounds[i + 1]] for i, key in enumerate(keys)}
+
+
+class SharedArrayStore:
+    """Named arrays published by one process and memory-mapped read-only by others.
+
+    Each publish writes a new version directory of .npy files and swapping
+    index.json commits it, so readers never see a half-written version and
+    every worker that opens the store shares one physical copy of each
+    array through the OS page cache.
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, path):
+        self.path = path
+        self.arrays = {}
+        self.meta = {}
+        self.version = None
+        self._index_mtime = None
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, self.INDEX_FILE)
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    def publish(self, arrays, meta=None, keep=2):
+        """Write arrays as a new version and make it current; returns the version id"""
+        version = uuid.uuid4().hex
+        directory = os.path.join(self.path, version)
+        os.makedirs(directory)
+        files = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            if array.dtype == object:
+                raise ValueError(f"Array {name} has object dtype and cannot be shared")
+            files[name] = f"{name}.npy"
+            np.save(os.path.join(directory, files[name]), array)
+
+        index = {'version': version, 'arrays': files, 'meta': meta or {}}
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+        logging.info(f"Published {len(files)} shared arrays as version {version} in {self.path}")
+
+        self._remove_old_versions(keep)
+        return version
+
+    def _remove_old_versions(self, keep):
+        # Workers still mapping a removed version keep their pages (POSIX)
+        versions = [entry for entry in os.scandir(self.path) if entry.is_dir()]
+        versions.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+        for entry in versions[keep:]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def open(self):
+        """Memory-map every array of the current version read-only"""
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        directory = os.path.join(self.path, index['version'])
+        arrays = {}
+        for name, file in index['arrays'].items():
+            path = os.path.join(directory, file)
+            try:
+                arrays[name] = np.load(path, mmap_mode='r')
+            except ValueError:
+                # Zero-length arrays cannot be mapped
+                arrays[name] = np.load(path)
+        self.arrays = arrays
+        self.meta = index['meta']
+        self.version = index['version']
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+        logging.info(f"Attached shared arrays version {self.version} ({len(arrays)} arrays)")
+        return self
+
+    def is_stale(self):
+        """Check (with one stat call) whether a newer version has been published"""
+        try:
+            return os.stat(self.index_path).st_mtime_ns != self._index_mtime
+        except OSError:
+            return False
@@ -0,0 +1,45 @@
+import atexit
+import os
+import subprocess
+import sys
+import threading
+import pytest
+
+flask = pytest.importorskip('flask')
+import app
+
+LIB = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_leaves_heavy_libraries_unloaded():
+    # A fresh interpreter, since other tests may already have imported them
+    code = (
+        "import sys, app\n"
+        "print(sorted({m.split('.')[0] for m in sys.modules} & {'sklearn', 'scipy', 'sentence_transformers'}))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=LIB, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == '[]'
+
+
+def test_ready_is_503_before_init():
+    response = app.app.test_client().get('/ready')
+
+    assert response.status_code == 503
+    assert response.get_json()['ready'] is False
+
+
+def test_failed_init_starts_nothing(monkeypatch):
+    def fail():
+        raise OSError("Disk not mounted")
+
+    monkeypatch.setattr(app, 'load_user_preferences', lambda: None)
+    monkeypatch.setattr(app, 'load_item_neighbours', fail)
+    threads, hooks = threading.active_count(), atexit._ncallbacks()
+
+    for _ in range(2):
+        with pytest.raises(OSError):
+            app.init_resources()
+
+    assert not app.resources_ready
+    assert threading.active_count() == threads and atexit._ncallbacks() == hooks
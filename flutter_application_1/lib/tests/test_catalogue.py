@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+from catalogue import Catalogue, normalise_catalogue
+from shared_catalogue import SharedArrayStore
+
+
+def make_frame():
+    raw = pd.DataFrame({
+        'asin': ['A1', 'A2', 'A1', 'A3', 'A4', 'A2'],
+        'title': ["Men's Watch", 'Doll', "Men's Watch", 'Café Mug', 'Doll', 'Doll v2'],
+        'department': ['Watches', 'Toys & Games', 'Watches', None, 'Toys & Games', 'Toys & Games'],
+        'bs_category': ['w', 't', 'w', 'k', 't', 't'],
+        'description': ['', 'for girls', '', '', '', ''],
+        'features': ['["steel", "quartz"]', '[]', None, '["ceramic"]', '["plastic"]', '[]'],
+        'images': ['[]', '["d.jpg"]', '[]', '[]', '[]', '[]'],
+        'url': [f"https://example.com/{i}" for i in range(6)],
+        'final_price': ['$120', '15', '120', '8.5', '12', '16'],
+        'rating': [4.5, 3.0, 4.5, None, 2.0, 3.5],
+    })
+    return normalise_catalogue(raw)
+
+
+@pytest.fixture(params=['built', 'mapped'])
+def catalogue(request, tmp_path):
+    built = Catalogue(make_frame())
+    if request.param == 'built':
+        return built
+    store = SharedArrayStore(str(tmp_path))
+    arrays, meta = built.to_arrays()
+    store.publish(arrays, meta)
+    store.open()
+    return Catalogue.from_arrays(store.arrays, store.meta)
+
+
+def test_lookups_match_the_frame(catalogue):
+    df = make_frame()
+
+    assert catalogue.row_for_asin('A2') == 1
+    assert catalogue.row_for_asin('missing') is None and catalogue.row_for_asin(None) is None
+    assert catalogue.rows_for_title('Doll') == [1, 4]
+    assert catalogue.rows_for_title('Café Mug') == [3]
+    assert list(catalogue.rows_for_department('Toys & Games')) == [1, 4, 5]
+    assert list(catalogue.department.groups) == [
+        'Watches', 'Toys & Games', 'Unknown Department'
+    ]
+    assert catalogue.asin_rows(['A3', 'nope', 'A1']).tolist() == [3, -1, 0]
+    assert catalogue.asin_id.tolist() == [0, 1, 0, 3, 4, 1]
+    assert catalogue.unique_rows.tolist() == [0, 1, 3, 4]
+    assert catalogue.texts() == df['text'].tolist()
+    assert catalogue.text('A4') == df['text'][4]
+
+
+def test_product_fields(catalogue):
+    product = catalogue.product('A1')
+
+    assert product['title'] == "Men's Watch" and product['gender_tag'] == 'men'
+    assert product['features'] == ['steel', 'quartz']
+    assert product['final_price'] == pytest.approx(120.0)
+    with pytest.raises(KeyError):
+        catalogue.product('missing')
+
+
+def test_frame_shares_the_catalogue_arrays(catalogue):
+    frame = catalogue.frame()
+
+    assert np.shares_memory(frame['final_price'].to_numpy(), catalogue.columns['final_price'])
+    assert frame['department'].tolist() == [catalogue.department[row] for row in range(len(catalogue))]
+    assert frame.drop_duplicates(subset=['asin_id']).index.tolist() == [0, 1, 3, 4]
@@ -0,0 +1,71 @@
+import gc
+import threading
+import time
+import weakref
+from catalogue_manager import CatalogueManager
+
+
+def make_manager(**kwargs):
+    builds = iter(range(100))
+    return CatalogueManager(lambda: {'rows': list(range(1000)), 'build': next(builds)}, **kwargs)
+
+
+def test_swap_does_not_wait_for_pinned_readers():
+    manager = make_manager()
+    manager.load()
+    pinned = manager.acquire()
+
+    start = time.monotonic()
+    manager.load()
+    fresh = manager.acquire()
+
+    assert time.monotonic() - start < 1
+    assert pinned.state['build'] == 0 and fresh.state['build'] == 1
+    assert manager.status()['in_flight_requests'] == 2
+    manager.release(pinned)
+    manager.release(fresh)
+    assert manager.status()['in_flight_requests'] == 0
+
+
+def test_reload_while_a_reader_is_pinned():
+    manager = make_manager()
+    manager.load()
+    pinned = manager.acquire()
+    assert manager.reload()
+    deadline = time.monotonic() + 5
+    while manager.reloading and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert manager.current is not pinned
+    assert [v['version_id'] for v in manager.status()['draining']] == [pinned.version_id]
+    manager.release(pinned)
+
+
+def test_retired_version_is_freed_once_its_readers_leave():
+    swapped = threading.Event()
+    manager = make_manager(after_swap=lambda state: swapped.set())
+    manager.load()
+    pinned = manager.acquire()
+    retired = weakref.ref(pinned)
+    manager.load()
+
+    assert swapped.is_set()
+    assert retired() is not None
+    manager.release(pinned)
+    del pinned
+    gc.collect()
+    assert retired() is None
+    assert manager.status()['draining'] == []
+
+
+def test_failed_build_keeps_the_live_version():
+    manager = make_manager()
+    live = manager.load()
+    manager.build = lambda: 1 / 0
+
+    try:
+        manager.load()
+    except ZeroDivisionError:
+        pass
+    assert manager.current is live
+    assert 'division' in manager.status()['last_error']
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from content_index import ContentIndex
+
+DEPARTMENTS = ["Electronics", "Toys & Games", "Beauty", "Sports & Outdoors", "Watches"]
+WORDS = ["wireless", "leather", "kids", "portable", "smart", "travel", "cotton", "games",
+         "beauty", "sports", "outdoors", "watch", "electronics", "toys", "the", "and"]
+
+
+def make_catalogue(n=300, seed=7):
+    rng = np.random.default_rng(seed)
+    features, categories = [], []
+    for i in range(n):
+        words = rng.choice(WORDS, size=rng.integers(0, 8))
+        features.append(" ".join(words))
+        picked = rng.choice(len(DEPARTMENTS), size=rng.integers(1, 3), replace=False)
+        categories.append([DEPARTMENTS[p] for p in picked] + [f"cat{i % 4}"])
+    # Products with no usable text at all
+    features[3] = ""
+    features[4] = "the and"
+    return features, categories
+
+
+def per_request_scores(features, categories, recent_departments):
+    """The content_based_filtering that fitted TfidfVectorizer on every request"""
+    rows = [i for i, cats in enumerate(categories) if any(dep in cats for dep in recent_departments)]
+    vectorizer = TfidfVectorizer(stop_words='english')
+    tfidf_matrix = vectorizer.fit_transform([features[i] for i in rows])
+    query_vector = vectorizer.transform([" ".join(recent_departments)])
+    return np.array(rows), cosine_similarity(query_vector, tfidf_matrix).flatten()
+
+
+@pytest.mark.parametrize("recent_departments", [
+    ["Electronics"],
+    ["Toys & Games", "Beauty"],
+    ["Sports & Outdoors", "Watches", "Electronics"],
+    ["cat2"],
+])
+def test_scores_match_per_request_tfidf(recent_departments):
+    features, categories = make_catalogue()
+    index = ContentIndex().build(features, categories)
+
+    expected_rows, expected = per_request_scores(features, categories, recent_departments)
+    rows = index.rows_in_categories(recent_departments)
+    scores = index.score(" ".join(recent_departments), rows)
+
+    np.testing.assert_array_equal(rows, expected_rows)
+    np.testing.assert_allclose(scores, expected, rtol=0, atol=1e-12)
+
+
+def test_scores_match_after_save_and_load(tmp_path):
+    features, categories = make_catalogue()
+    path = str(tmp_path / "content_index.npz")
+    ContentIndex().build(features, categories, fingerprint="abc").save(path)
+    index = ContentIndex.load(path)
+
+    expected_rows, expected = per_request_scores(features, categories, ["Beauty", "Watches"])
+    scores = index.score("Beauty Watches", index.rows_in_categories(["Beauty", "Watches"]))
+
+    assert index.fingerprint == "abc"
+    np.testing.assert_allclose(scores, expected, rtol=0, atol=1e-12)
+
+
+def test_query_without_known_terms_scores_zero():
+    features, categories = make_catalogue()
+    index = ContentIndex().build(features, categories)
+    rows = index.rows_in_categories(["cat1"])
+
+    assert not index.score("cat1", rows).any()
+    assert len(index.rows_in_categories(["Unknown"])) == 0
+
+
+def test_scores_match_when_mapped_from_a_shared_store(tmp_path):
+    from shared_catalogue import SharedArrayStore
+    features, categories = make_catalogue()
+    arrays, meta = ContentIndex().build(features, categories).to_arrays()
+    store = SharedArrayStore(str(tmp_path))
+    store.publish(arrays, meta)
+    store.open()
+    index = ContentIndex.from_arrays(store.arrays, store.meta)
+
+    expected_rows, expected = per_request_scores(features, categories, ["Electronics", "cat3"])
+    rows = index.rows_in_categories(["Electronics", "cat3"])
+
+    assert np.shares_memory(index.counts.data, store.arrays['data'])
+    np.testing.assert_array_equal(rows, expected_rows)
+    np.testing.assert_allclose(index.score("Electronics cat3", rows), expected, rtol=0, atol=1e-12)
@@ -0,0 +1,99 @@
+import os
+import time
+import pytest
+import interaction_log
+from interaction_log import InteractionLogWriter, read_interactions
+
+
+def interaction(i):
+    return {'user_id': f"u{i}", 'product_id': f"p{i}", 'interaction_type': 'like', 'timestamp': f"t{i}"}
+
+
+@pytest.fixture
+def writer(tmp_path):
+    # Large batch and interval so only the test flushes
+    writer = InteractionLogWriter(str(tmp_path / "interactions_log.csv"), batch_size=1000, flush_interval=60)
+    yield writer
+    writer.close()
+
+
+def assert_offsets_match_rows(writer, count):
+    for number in range(1, count + 1):
+        rows, _ = read_interactions(writer.path, writer.offset_for(number))
+        assert [row['user_id'] for row in rows] == [f"u{i}" for i in range(number, count)]
+
+
+def test_rows_survive_a_failed_open(writer, monkeypatch):
+    for i in range(3):
+        writer.write(interaction(i))
+    real_open = open
+    failures = []
+
+    def open_failing_once(*args, **kwargs):
+        if not failures:
+            failures.append(args)
+            raise OSError("No space left on device")
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr(interaction_log, 'open', open_failing_once, raising=False)
+    with pytest.raises(OSError):
+        writer.flush()
+
+    assert writer.pending() == 3
+    assert writer.rows_written == 0 and writer.offset_for(1) is None
+
+    writer.write(interaction(3))
+    assert writer.flush() == 4
+    rows, _ = read_interactions(writer.path)
+    assert [row['user_id'] for row in rows] == ['u0', 'u1', 'u2', 'u3']
+    assert_offsets_match_rows(writer, 4)
+
+
+def test_failed_fsync_leaves_no_partial_batch(writer, monkeypatch):
+    writer.write(interaction(0))
+    writer.flush()
+    size = os.path.getsize(writer.path)
+    writer.write(interaction(1))
+    writer.write(interaction(2))
+    real_fsync = os.fsync
+    failures = []
+
+    def fsync_failing_once(fd):
+        if not failures:
+            failures.append(fd)
+            raise OSError("Input/output error")
+        return real_fsync(fd)
+
+    monkeypatch.setattr(interaction_log.os, 'fsync', fsync_failing_once)
+    with pytest.raises(OSError):
+        writer.flush()
+
+    assert os.path.getsize(writer.path) == size
+    assert writer.flush() == 2
+    rows, _ = read_interactions(writer.path)
+    assert [row['user_id'] for row in rows] == ['u0', 'u1', 'u2']
+    assert_offsets_match_rows(writer, 3)
+
+
+def test_background_thread_retries_a_failed_batch(tmp_path, monkeypatch):
+    writer = InteractionLogWriter(str(tmp_path / "interactions_log.csv"), batch_size=1000, flush_interval=0.05)
+    real_open = open
+    failures = []
+
+    def open_failing_twice(*args, **kwargs):
+        if len(failures) < 2:
+            failures.append(args)
+            raise OSError("No space left on device")
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr(interaction_log, 'open', open_failing_twice, raising=False)
+    numbers = [writer.write(interaction(i)) for i in range(5)]
+    deadline = time.monotonic() + 5
+    while writer.rows_written < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.close()
+
+    rows, _ = read_interactions(writer.path)
+    assert numbers == [1, 2, 3, 4, 5]
+    assert [row['user_id'] for row in rows] == [f"u{i}" for i in range(5)]
+    assert_offsets_match_rows(writer, 5)
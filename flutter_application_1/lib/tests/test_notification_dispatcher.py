@@ -0,0 +1,190 @@
+import asyncio
+import queue
+import socket
+import threading
+import time
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+from notification_dispatcher import MAX_TOKENS_PER_REQUEST, NotificationDispatcher
+
+
+class StandInFCM:
+    """Local stand-in for the FCM legacy endpoint, served from its own loop thread.
+
+    Responses are taken from `script` ((status, headers, delay) per request)
+    while it lasts; after that every request gets a 200 FCM-style result.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.peers = set()
+        self.script = []
+        self._sock = socket.socket()
+        self._sock.bind(('127.0.0.1', 0))
+        self.url = f"http://127.0.0.1:{self._sock.getsockname()[1]}/fcm/send"
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        app.router.add_post('/fcm/send', self._send)
+        runner = web.AppRunner(app)
+        self.loop.run_until_complete(runner.setup())
+        self.loop.run_until_complete(web.SockSite(runner, self._sock).start())
+        self._ready.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(runner.cleanup())
+        self.loop.close()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(5)
+
+    async def _send(self, request):
+        payload = await request.json()
+        self.requests.append({
+            'payload': payload,
+            'authorization': request.headers.get('Authorization'),
+            'at': time.monotonic(),
+        })
+        self.peers.add(request.transport.get_extra_info('peername'))
+        status, headers, delay = self.script.pop(0) if self.script else (200, {}, 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if status != 200:
+            return web.json_response({'error': 'Unavailable'}, status=status, headers=headers)
+        tokens = payload.get('registration_ids') or [payload['to']]
+        return web.json_response({'success': len(tokens), 'failure': 0})
+
+
+@pytest.fixture
+def fcm():
+    server = StandInFCM().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def dispatchers():
+    started = []
+
+    def start(url, **kwargs):
+        dispatcher = NotificationDispatcher(url, **kwargs).start()
+        started.append(dispatcher)
+        return dispatcher
+
+    yield start
+    for dispatcher in started:
+        dispatcher.stop(timeout=1)
+
+
+def test_send_relays_the_fcm_result(fcm, dispatchers):
+    dispatcher = dispatchers(fcm.url, server_key='test-key')
+
+    result = dispatcher.send('token-1', 'Title', 'Body').result(5)
+
+    assert result == {'status': 200, 'body': {'success': 1, 'failure': 0}, 'attempts': 1}
+    assert fcm.requests[0]['authorization'] == 'key=test-key'
+    assert fcm.requests[0]['payload'] == {'to': 'token-1', 'notification': {'title': 'Title', 'body': 'Body'}}
+    assert dispatcher.stats()['sent'] == 1
+
+
+def test_requests_reuse_pooled_connections(fcm, dispatchers):
+    dispatcher = dispatchers(fcm.url, concurrency=4)
+
+    futures = [dispatcher.send(f"token-{i}", 'Title', 'Body') for i in range(40)]
+
+    assert all(f.result(5)['status'] == 200 for f in futures)
+    assert len(fcm.requests) == 40
+    assert len(fcm.peers) <= 4
+
+
+def test_retry_after_is_honoured(fcm, dispatchers):
+    # Without Retry-After the backoff would be 2.5-5 seconds
+    fcm.script = [(503, {'Retry-After': '0.2'}, 0)]
+    dispatcher = dispatchers(fcm.url, backoff=5.0)
+
+    result = dispatcher.send('token-1', 'Title', 'Body').result(5)
+
+    assert result['status'] == 200 and result['attempts'] == 2
+    assert 0.15 <= fcm.requests[1]['at'] - fcm.requests[0]['at'] < 2
+    assert dispatcher.stats()['retried'] == 1
+
+
+def test_server_errors_are_retried_until_max_retries(fcm, dispatchers):
+    fcm.script = [(500, {}, 0)] * 3
+    dispatcher = dispatchers(fcm.url, max_retries=2, backoff=0.01)
+
+    result = dispatcher.send('token-1', 'Title', 'Body').result(5)
+
+    assert result['status'] == 500 and result['attempts'] == 3
+    assert dispatcher.stats()['failed'] == 1 and dispatcher.stats()['retried'] == 2
+
+
+def test_client_errors_are_not_retried(fcm, dispatchers):
+    fcm.script = [(400, {}, 0)]
+    dispatcher = dispatchers(fcm.url, backoff=0.01)
+
+    result = dispatcher.send('token-1', 'Title', 'Body').result(5)
+
+    assert result['status'] == 400 and result['attempts'] == 1
+    assert len(fcm.requests) == 1
+
+
+def test_slow_responses_time_out(fcm, dispatchers):
+    fcm.script = [(200, {}, 2.0)]
+    dispatcher = dispatchers(fcm.url, timeout=0.3, max_retries=0)
+
+    with pytest.raises(asyncio.TimeoutError):
+        dispatcher.send('token-1', 'Title', 'Body').result(5)
+    assert dispatcher.stats()['failed'] == 1
+
+
+def test_connection_errors_are_retried():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        url = f"http://127.0.0.1:{sock.getsockname()[1]}/fcm/send"
+    dispatcher = NotificationDispatcher(url, max_retries=2, backoff=0.01).start()
+    try:
+        with pytest.raises(aiohttp.ClientConnectionError):
+            dispatcher.send('token-1', 'Title', 'Body').result(5)
+        assert dispatcher.stats()['retried'] == 2
+    finally:
+        dispatcher.stop(timeout=1)
+
+
+def test_send_many_batches_tokens_per_request(fcm, dispatchers):
+    dispatcher = dispatchers(fcm.url)
+    tokens = [f"token-{i}" for i in range(2500)] + ['token-0', 'token-1']
+
+    futures = dispatcher.send_many(tokens, 'Title', 'Body')
+
+    assert [f.result(5)['status'] for f in futures] == [200, 200, 200]
+    sizes = sorted(len(r['payload']['registration_ids']) for r in fcm.requests)
+    assert sizes == [500, MAX_TOKENS_PER_REQUEST, MAX_TOKENS_PER_REQUEST]
+    sent = [token for r in fcm.requests for token in r['payload']['registration_ids']]
+    assert sorted(sent) == sorted(set(tokens))
+
+
+def test_full_queue_rejects_new_messages(fcm, dispatchers):
+    fcm.script = [(200, {}, 0.5)] * 2
+    dispatcher = dispatchers(fcm.url, max_queue=2)
+
+    futures = [dispatcher.send('token-1', 'Title', 'Body'), dispatcher.send('token-2', 'Title', 'Body')]
+    with pytest.raises(queue.Full):
+        dispatcher.send('token-3', 'Title', 'Body')
+    rejected = dispatcher.send_many(['token-4'], 'Title', 'Body')
+
+    assert isinstance(rejected[0].exception(), queue.Full)
+    assert all(f.result(5)['status'] == 200 for f in futures)
+    assert dispatcher.send('token-5', 'Title', 'Body').result(5)['status'] == 200
+    assert dispatcher.stats()['rejected'] == 2
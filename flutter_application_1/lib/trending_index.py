@@ -0,0 +1,94 @@
+import random
+import logging
+import numpy as np
+import pandas as pd
+from shared_catalogue import pack_groups, unpack_groups
+
+PRICE_BANDS = ["0-50", "50-100", "100+"]
+
+
+def price_bands(prices):
+    """Price band label for each price"""
+    prices = np.asarray(prices)
+    return np.select([prices < 50, prices < 100], PRICE_BANDS[:2], PRICE_BANDS[2])
+
+
+def _group(rows, keys):
+    """{key: rows with that key}, each keeping the order of `rows`"""
+    codes, uniques = pd.factorize(keys)
+    by_code = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[by_code], np.arange(len(uniques) + 1))
+    return {key: rows[by_code[bounds[i]:bounds[i + 1]]] for i, key in enumerate(uniques)}
+
+
+class TrendingIndex:
+    """Catalogue rows ordered by popularity, whole and per segment.
+
+    Rows are sorted once with argsort (one row per asin); each department,
+    price band and (department, price band) segment keeps its rows in the
+    same order, so the top of any segment is a slice and a random draw is
+    a handful of index lookups.
+    """
+
+    def __init__(self):
+        self.order = np.array([], dtype=np.int64)
+        self.by_department = {}
+        self.by_price_band = {}
+        self.by_segment = {}
+        self.source = None
+
+    def build(self, asins, popularity, departments, prices, source=None):
+        popularity = np.asarray(popularity, dtype=np.float64)
+        # Stable sort keeps catalogue order among equal popularity
+        order = np.argsort(-popularity, kind='stable')
+        order = order[~pd.Series(np.asarray(asins, dtype=object)[order]).duplicated().to_numpy()]
+
+        departments = np.asarray(departments, dtype=object)[order]
+        bands = price_bands(np.asarray(prices)[order]).astype(object)
+        self.order = order
+        self.by_department = _group(order, departments)
+        self.by_price_band = _group(order, bands)
+        self.by_segment = _group(order, pd.Series(list(zip(departments, bands)), dtype=object))
+        self.source = source
+        logging.info(f"Built trending index over {len(order)} products, {len(self.by_segment)} segments")
+        return self
+
+    def to_arrays(self):
+        """(arrays, meta) describing the index, for from_arrays in another process"""
+        arrays = {'order': self.order}
+        meta = {}
+        for name in ('by_department', 'by_price_band', 'by_segment'):
+            keys, arrays[f"{name}_bounds"], arrays[f"{name}_rows"] = pack_groups(getattr(self, name))
+            # JSON has no tuples; segment keys come back as lists
+            meta[name] = [list(k) if isinstance(k, tuple) else k for k in keys]
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta, source=None):
+        """Index over arrays from to_arrays (typically memory-mapped); nothing is copied"""
+        index = cls()
+        index.order = arrays['order']
+        for name in ('by_department', 'by_price_band', 'by_segment'):
+            keys = [tuple(k) if isinstance(k, list) else k for k in meta[name]]
+            setattr(index, name, unpack_groups(keys, arrays[f"{name}_bounds"], arrays[f"{name}_rows"]))
+        index.source = source
+        return index
+
+    def rows(self, department=None, price_band=None):
+        """Rows of a segment in trending order"""
+        if department and price_band:
+            return self.by_segment.get((department, price_band), self.order[:0])
+        if department:
+            return self.by_department.get(department, self.order[:0])
+        if price_band:
+            return self.by_price_band.get(price_band, self.order[:0])
+        return self.order
+
+    def top(self, limit, department=None, price_band=None):
+        return self.rows(department, price_band)[:limit]
+
+    def sample(self, limit, department=None, price_band=None, rng=random):
+        """Random rows from a segment without replacement"""
+        rows = self.rows(department, price_band)
+        picks = rng.sample(range(len(rows)), min(limit, len(rows)))
+        return rows[picks]
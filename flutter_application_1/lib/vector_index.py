@@ -0,0 +1,215 @@
+import logging
+import time
+import numpy as np
+from shared_catalogue import pack_groups, unpack_groups
+
+
+def normalise_rows(matrix):
+    """L2-normalise rows so a dot product equals cosine similarity"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorIndex:
+    """IVF (inverted file) index for approximate cosine nearest neighbours.
+
+    Vectors are grouped under k-means centroids; a query only scores the
+    vectors in its `n_probe` closest lists. `exact=True` scores everything
+    and is used to check recall. Built over vectors that are already
+    normalised (the memory-mapped embedding store) it only reads them, so
+    the centroids and lists are all it holds privately.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, n_iter=10, train_size=20000, seed=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.train_size = train_size
+        self.seed = seed
+        self.version = None
+        self.vectors = None
+        self.rows = None
+        self.ids = None
+        self.id_to_pos = {}
+        self.departments = None
+        self.centroids = None
+        self.lists = []
+        self.department_rows = {}
+
+    def build(self, vectors, ids, departments=None, version=None, rows=None, normalised=False):
+        """Cluster the vectors and fill the inverted lists.
+
+        `rows` is the row of `vectors` holding each id's vector (by default
+        row i belongs to ids[i]). With `normalised` the rows are read in
+        place; otherwise the index keeps a normalised copy of them.
+        """
+        start = time.time()
+        self.ids = np.asarray(ids, dtype=np.int64)
+        if normalised:
+            self.vectors = vectors
+            self.rows = None if rows is None else np.asarray(rows, dtype=np.int64)
+        else:
+            self.vectors = normalise_rows(vectors if rows is None else vectors[rows])
+            self.rows = None
+        if len(self.ids) > 1 and np.any(np.diff(self.ids) <= 0):
+            self.id_to_pos = {int(id_): pos for pos, id_ in enumerate(self.ids)}
+        else:
+            # Sorted ids, so vector_for can bisect instead of holding a dict
+            self.id_to_pos = None
+        n = len(self.ids)
+        if departments is None:
+            departments = np.full(n, None, dtype=object)
+        self.departments = np.asarray(departments, dtype=object)
+
+        # Positions of each department for filtered searches
+        self.department_rows = {}
+        for pos, dept in enumerate(self.departments):
+            self.department_rows.setdefault(dept, []).append(pos)
+        self.department_rows = {d: np.array(p, dtype=np.int64) for d, p in self.department_rows.items()}
+
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n) if n else 0
+        self.centroids = self._kmeans(n_lists) if n_lists else np.zeros((0, self.vectors.shape[1]), dtype=np.float32)
+
+        assignments = self._assign()
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+        self.version = version
+        logging.info(
+            f"Built vector index over {n} products with {len(self.lists)} lists "
+            f"in {time.time() - start:.2f}s"
+        )
+        return self
+
+    def to_arrays(self):
+        """(arrays, meta) describing the built index, for from_arrays in another process"""
+        if len(self.ids) > 1 and np.any(np.diff(self.ids) <= 0):
+            raise ValueError("Only indexes with sorted, unique ids can be shared")
+        _, list_bounds, list_rows = pack_groups(dict(enumerate(self.lists)))
+        departments, department_bounds, department_rows = pack_groups(self.department_rows)
+        arrays = {
+            'vectors': self._vectors(slice(None)),
+            'ids': self.ids,
+            'departments': self.departments.astype(str),
+            'centroids': self.centroids,
+            'list_rows': list_rows,
+            'list_bounds': list_bounds,
+            'department_rows': department_rows,
+            'department_bounds': department_bounds,
+        }
+        meta = {'version': self.version, 'n_probe': self.n_probe, 'departments': [str(d) for d in departments]}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Index over arrays from to_arrays (typically memory-mapped); nothing is copied"""
+        index = cls(n_probe=meta['n_probe'])
+        index.vectors = arrays['vectors']
+        index.ids = arrays['ids']
+        index.id_to_pos = None
+        index.departments = arrays['departments']
+        index.centroids = arrays['centroids']
+        n_lists = len(arrays['list_bounds']) - 1
+        index.lists = list(unpack_groups(range(n_lists), arrays['list_bounds'], arrays['list_rows']).values())
+        index.department_rows = unpack_groups(meta['departments'], arrays['department_bounds'], arrays['department_rows'])
+        index.version = meta['version']
+        return index
+
+    def _vectors(self, positions):
+        """Normalised vectors at index positions (an int, array or slice)"""
+        if self.rows is None:
+            return self.vectors[positions]
+        return self.vectors[self.rows[positions]]
+
+    def _kmeans(self, n_lists):
+        rng = np.random.default_rng(self.seed)
+        n = len(self.ids)
+        sample = np.sort(rng.choice(n, size=min(n, max(self.train_size, n_lists)), replace=False))
+        train = np.asarray(self._vectors(sample), dtype=np.float32)
+        centroids = train[rng.choice(len(train), size=n_lists, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            labels = np.argmax(train @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = train[labels == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+                else:
+                    # Re-seed empty clusters with a random training vector
+                    centroids[c] = train[rng.integers(len(train))]
+            centroids = normalise_rows(centroids)
+        return centroids
+
+    def _assign(self, chunk_size=8192):
+        n = len(self.ids)
+        labels = np.empty(n, dtype=np.int64)
+        for i in range(0, n, chunk_size):
+            labels[i:i + chunk_size] = np.argmax(self._vectors(slice(i, i + chunk_size)) @ self.centroids.T, axis=1)
+        return labels
+
+    def vector_for(self, id_):
+        """Normalised vector stored for an id, or None"""
+        if self.id_to_pos is None:
+            pos = int(np.searchsorted(self.ids, int(id_)))
+            return self._vectors(pos) if pos < len(self.ids) and self.ids[pos] == int(id_) else None
+        pos = self.id_to_pos.get(int(id_))
+        return self._vectors(pos) if pos is not None else None
+
+    def vectors_for(self, ids):
+        """(mask of the ids that have a vector, their normalised vectors)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.id_to_pos is None:
+            positions = np.minimum(np.searchsorted(self.ids, ids), max(len(self.ids) - 1, 0))
+            found = self.ids[positions] == ids if len(self.ids) else np.zeros(len(ids), dtype=bool)
+        else:
+            positions = np.fromiter((self.id_to_pos.get(int(id_), -1) for id_ in ids), dtype=np.int64, count=len(ids))
+            found = positions >= 0
+        return found, self._vectors(positions[found])
+
+    def search(self, query, k=8, department=None, exclude=None, exact=False):
+        """Top-k (ids, cosine scores) for a query vector"""
+        if self.vectors is None or not len(self.ids):
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        query = normalise_rows(np.asarray(query).reshape(1, -1))[0]
+
+        if exact:
+            candidates = np.arange(len(self.ids))
+        else:
+            n_probe = min(self.n_probe, len(self.centroids))
+            probed = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+            candidates = np.concatenate([self.lists[c] for c in probed])
+
+        if department is not None:
+            dept_rows = self.department_rows.get(department, np.array([], dtype=np.int64))
+            in_dept = candidates[self.departments[candidates] == department]
+            # Small departments may not show up in the probed lists at all
+            candidates = in_dept if len(in_dept) >= k else dept_rows
+
+        if exclude is not None and len(exclude):
+            candidates = candidates[~np.isin(self.ids[candidates], np.asarray(list(exclude)))]
+
+        if not len(candidates):
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        scores = self._vectors(candidates) @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return self.ids[candidates[top]], scores[top]
+
+    def recall(self, k=10, sample=100, department=None):
+        """Share of exact top-k neighbours that the approximate search also finds"""
+        rng = np.random.default_rng(self.seed)
+        picks = rng.choice(len(self.ids), size=min(sample, len(self.ids)), replace=False)
+        hits, total = 0, 0
+        for pos in picks:
+            approx, _ = self.search(self._vectors(pos), k, department=department)
+            exact, _ = self.search(self._vectors(pos), k, department=department, exact=True)
+            hits += len(np.intersect1d(approx, exact))
+            total += len(exact)
+        return hits / total if total else 0.0